@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+"""Benchmark the REP build pipeline.
+
+Usage: %(PROGRAM)s [options]
+
+Each stage of the build is timed over a scratch copy of the real REPs and,
+optionally, over synthetic corpora of generated REPs.  Every stage runs in
+a fresh interpreter, with the build caches removed, so that each stage's
+peak memory use can be reported on its own and no stage benefits from the
+work of another.
+
+Stages: %(STAGE_NAMES)s
+
+Options:
+
+-s N, --scale=N
+    Also benchmark a synthetic corpus of N generated REPs, with realistic
+    headers, tables, literal blocks and mermaid diagrams.  May be given
+    more than once.
+
+-r, --no-real
+    Do not benchmark the real REPs.
+
+-t STAGE, --stage=STAGE
+    Only run STAGE.  May be given more than once.
+
+-n N, --outliers=N
+    List the N slowest REPs of each per-REP stage (default: 3).
+
+-o FILE, --save=FILE
+    Save the results to FILE, to be used as a baseline later.
+
+-c FILE, --compare=FILE
+    Compare the results with the baseline in FILE, and exit with status 1
+    if any stage got slower by more than the tolerance.
+
+--tolerance=PERCENT
+    Slowdown allowed by --compare before a stage counts as a regression
+    (default: 20).  Differences under %(NOISE)s seconds are never counted,
+    as they are within the run-to-run noise of the quick stages.
+
+-h, --help
+    Print this help message and exit.
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import io
+import glob
+import json
+import getopt
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from rep0.metadata import get_store
+from repbuild.styles import BUNDLE_SOURCES
+
+PROGRAM = sys.argv[0]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Files, other than the REPs, that a corpus needs in order to be built.
+SUPPORT_FILES = ['rep-html-template', 'docutils.conf'] + [
+    path for path, media in BUNDLE_SOURCES]
+# Caches the build leaves behind, files and directories; removed before
+# each stage.
+CACHE_FILES = ['.rep2html-manifest.json', '.rep-metadata.json',
+               '.rep-body-cache.json', '.rep-doctree-cache',
+               '.rep-mermaid-cache', 'assets']
+# Slowdowns smaller than this (in seconds) are treated as noise.
+NOISE = 0.05
+
+
+def usage(code, msg=''):
+    """Print usage message and exit.  Uses stderr if code != 0."""
+    if code == 0:
+        out = sys.stdout
+    else:
+        out = sys.stderr
+    print(__doc__ % dict(globals(), STAGE_NAMES=', '.join(STAGE_NAMES)),
+          file=out)
+    if msg:
+        print(msg, file=out)
+    sys.exit(code)
+
+
+def rep_files():
+    files = glob.glob('rep-*.rst')
+    files.sort()
+    return files
+
+
+def _time_each(files, func):
+    """Call func(file) for each file; return (total, {file: seconds})."""
+    per_rep = {}
+    start = time.time()
+    for file in files:
+        before = time.time()
+        func(file)
+        per_rep[file] = time.time() - before
+    return time.time() - start, per_rep
+
+
+def _render_to_memory(render, rep_type):
+    import rep2html
+
+    def run(file):
+        input_lines = rep2html.get_input_lines(file)
+        outfile = io.BytesIO()
+        outfile.name = os.path.splitext(file)[0] + '.html'
+        render(file, input_lines, outfile)
+    store = get_store()
+    return [file for file in rep_files()
+            if store.get(file)['content_type'] == rep_type], run
+
+
+def stage_genrepindex():
+    import genrepindex
+    start = time.time()
+    genrepindex.main(['genrepindex.py', '.'])
+    return time.time() - start, {}
+
+
+def stage_write_rep0():
+    import genrepindex
+    from rep0 import output
+    reps = genrepindex.load_reps('.')
+    start = time.time()
+    output.write_rep0(reps, io.StringIO())
+    return time.time() - start, {}
+
+
+def stage_fixfile():
+    import rep2html
+    files, run = _render_to_memory(rep2html.fixfile, 'text/plain')
+    return _time_each(files, run)
+
+
+def stage_fix_rst_rep():
+    import rep2html
+    files, run = _render_to_memory(rep2html.fix_rst_rep, 'text/x-rst')
+    return _time_each(files, run)
+
+
+def stage_make_html():
+    import rep2html
+    rep2html.check_requirements()
+    return _time_each(rep_files(), rep2html.make_html)
+
+
+def stage_fixlinks():
+    import rep2html
+    lines = []
+    for file in rep_files():
+        lines.extend(rep2html.get_input_lines(file))
+    start = time.time()
+    for line in lines:
+        rep2html.fixlinks('rep-0000.rst', line)
+    wall = time.time() - start
+    return wall, {}, len(''.join(lines).encode('utf-8'))
+
+
+def stage_xsdvalid():
+    import xmlschema
+    start = time.time()
+    for path in sorted(glob.glob(os.path.join(HERE, 'xsd',
+                                              'package_format*.xsd'))):
+        xmlschema.XMLSchema(path)
+    return time.time() - start, {}
+
+
+STAGES = [
+    ('genrepindex', stage_genrepindex),
+    ('write_rep0', stage_write_rep0),
+    ('fixfile', stage_fixfile),
+    ('fixlinks', stage_fixlinks),
+    ('fix_rst_rep', stage_fix_rst_rep),
+    ('make_html', stage_make_html),
+    ('xsdvalid', stage_xsdvalid),
+    ]
+STAGE_NAMES = [name for name, func in STAGES]
+# Stages that do not depend on the REPs, run for the real corpus only.
+CORPUS_INDEPENDENT = ('xsdvalid',)
+
+
+def run_stage_here(name):
+    """Run stage `name` in the current process and directory, and print its
+    results as JSON.  This is what the child interpreters do."""
+    sys.path.insert(0, HERE)
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        # Stages return (wall, per_rep), plus the bytes they processed if
+        # their throughput is of interest.
+        result = dict(STAGES)[name]() + (None,)
+        wall, per_rep, size = result[:3]
+    finally:
+        sys.stdout = stdout
+    maxrss = None
+    if resource is not None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            maxrss //= 1024     # bytes, not kilobytes
+    json.dump({'wall': wall, 'per_rep': per_rep, 'bytes': size,
+               'maxrss_kb': maxrss}, sys.stdout)
+
+
+def run_stage(name, corpus):
+    for cache in CACHE_FILES:
+        path = os.path.join(corpus, cache)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), '--child', name],
+        cwd=corpus)
+    return json.loads(output.decode('utf-8'))
+
+
+def prepare_corpus(corpus, scale=None):
+    """Fill the directory `corpus` with REPs to build."""
+    for name in SUPPORT_FILES:
+        destination = os.path.join(corpus, name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy(os.path.join(HERE, name), destination)
+    if scale is None:
+        for path in glob.glob(os.path.join(HERE, 'rep-*.rst')):
+            if os.path.basename(path) != 'rep-0000.rst':
+                shutil.copy(path, corpus)
+    else:
+        generate_corpus(corpus, scale)
+    # fixfile needs a REP 0 to work on.
+    subprocess.check_call(
+        [sys.executable, os.path.join(HERE, 'genrepindex.py'), '.'],
+        cwd=corpus)
+
+
+FIRST_NAMES = ['Ada', 'Brian', 'Chen', 'Dolores', 'Emeka', 'Fatima', 'Gus',
+               'Hiroshi', 'Ines', 'Jorge', 'Katrin', 'Lars', 'Mei', 'Noor',
+               'Olga', 'Pedro', 'Quinn', 'Rosa', 'Sven', 'Tariq']
+LAST_NAMES = ['Abbott', 'Becker', 'Costa', 'van Dijk', 'Eriksen', 'Fujita',
+              'Garcia', 'Haddad', 'Ivanova', 'Jensen', 'Kowalski', 'Lopez',
+              'Moreau', 'Nakamura', 'Okafor', 'Petrov', 'Quiroga', 'Rossi',
+              'Schmidt', 'Tanaka']
+WORDS = ('robot frame message topic node parameter launch package build '
+         'transform sensor driver interface service action timestamp '
+         'namespace coordinate convention standard release distribution '
+         'dependency manifest schema velocity odometry').split()
+KINDS = [('Standards Track', ['Draft', 'Accepted', 'Final', 'Rejected',
+                              'Withdrawn', 'Deferred']),
+         ('Informational', ['Active', 'Draft', 'Final']),
+         ('Process', ['Active', 'Draft'])]
+
+MERMAID = """
+.. raw:: html
+
+  <div class="mermaid">
+  graph LR
+      A[%s] -- %s --> B((%s))
+      A --> C(%s)
+      B --> D{%s}
+      C --> D
+  </div>
+"""
+
+
+def _sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def generate_rep(rng, number, authors):
+    """Return the reST source of a synthetic REP."""
+    kind, statuses = rng.choice(KINDS)
+    lines = [
+        'REP: %d' % number,
+        'Title: %s' % _sentence(rng, rng.randint(3, 12))[:-1],
+        'Author: %s' % ', '.join(
+            '%s <%s>' % author
+            for author in rng.sample(authors, rng.randint(1, 3))),
+        'Status: %s' % rng.choice(statuses),
+        'Type: %s' % kind,
+        'Content-Type: text/x-rst',
+        ]
+    if number > 1000 and rng.random() < 0.2:
+        lines.append('Requires: %d' % rng.randint(1000, number - 1))
+    lines += ['Created: 01-Jan-2020', 'Post-History: 01-Jan-2020', '']
+    for section in range(rng.randint(3, 8)):
+        title = _sentence(rng, 3)[:-1]
+        lines += [title, '=' * len(title), '']
+        for paragraph in range(rng.randint(1, 5)):
+            lines.append(' '.join(_sentence(rng)
+                                  for _ in range(rng.randint(2, 6))))
+            lines.append('See REP %d and http://wiki.ros.org/%s.'
+                         % (rng.randint(1, number), rng.choice(WORDS)))
+            lines.append('')
+        if rng.random() < 0.5:
+            lines += ['=========  =========  ==========',
+                      'Name       Type       Unit',
+                      '=========  =========  ==========']
+            for row in range(rng.randint(2, 10)):
+                lines.append('  '.join(rng.choice(WORDS)[:9].ljust(9)
+                                       for _ in range(3)))
+            lines += ['=========  =========  ==========', '']
+        if rng.random() < 0.3:
+            lines += ['::', '']
+            lines += ['    %s' % _sentence(rng) for _ in range(5)]
+            lines.append('')
+        if rng.random() < 0.1:
+            lines.append(MERMAID % tuple(rng.choice(WORDS)
+                                         for _ in range(5)))
+    lines += ['Copyright', '=========', '',
+              'This document has been placed in the public domain.', '']
+    return '\n'.join(lines)
+
+
+def generate_corpus(corpus, count, seed=0):
+    """Write `count` synthetic REPs into the directory `corpus`."""
+    rng = random.Random(seed)
+    authors = []
+    for index in range(max(20, count // 5)):
+        first = FIRST_NAMES[index % len(FIRST_NAMES)]
+        last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+        if index >= len(FIRST_NAMES) * len(LAST_NAMES):
+            last = '%s%d' % (last, index)
+        name = '%s %s' % (first, last)
+        email = '%s.%s@example.org' % (first.lower(),
+                                       last.replace(' ', '').lower())
+        authors.append((name, email))
+    for number in range(1000, 1000 + count):
+        with io.open(os.path.join(corpus, 'rep-%04d.rst' % number), 'w',
+                     encoding='utf-8') as f:
+            f.write(generate_rep(rng, number, authors))
+
+
+def benchmark(label, scale, stages):
+    corpus = tempfile.mkdtemp(prefix='rep-bench-')
+    try:
+        prepare_corpus(corpus, scale)
+        results = {}
+        for name in stages:
+            if scale is not None and name in CORPUS_INDEPENDENT:
+                continue
+            results[name] = run_stage(name, corpus)
+            report_stage(label, name, results[name])
+        return results
+    finally:
+        shutil.rmtree(corpus)
+
+
+outliers = 3
+
+
+def report_stage(label, name, result):
+    per_rep = result['per_rep']
+    line = '%-16s %-12s %9.3fs' % (label, name, result['wall'])
+    if per_rep:
+        line += '  %5d REPs %8.1f ms/REP' % (
+            len(per_rep), 1000 * result['wall'] / len(per_rep))
+    if result.get('bytes') and result['wall']:
+        line += '  %8.2f MB/s' % (result['bytes'] / result['wall'] / 1e6)
+    if result['maxrss_kb']:
+        line += '  peak RSS %6.1f MB' % (result['maxrss_kb'] / 1024.0)
+    print(line)
+    slowest = sorted(per_rep.items(), key=lambda item: -item[1])[:outliers]
+    for file, seconds in slowest:
+        print('%-16s   slowest: %s %.1f ms' % ('', file, 1000 * seconds))
+    sys.stdout.flush()
+
+
+def compare(results, baseline, tolerance):
+    """Print stage-by-stage changes; return the list of regressions."""
+    regressions = []
+    print()
+    print('Compared with baseline:')
+    for label in sorted(results):
+        for name, result in sorted(results[label].items()):
+            old = baseline.get(label, {}).get(name)
+            if not old or not old['wall']:
+                continue
+            change = 100.0 * (result['wall'] - old['wall']) / old['wall']
+            flag = ''
+            if change > tolerance and result['wall'] - old['wall'] > NOISE:
+                flag = '  REGRESSION'
+                regressions.append((label, name))
+            print('%-16s %-12s %9.3fs -> %9.3fs  %+6.1f%%%s'
+                  % (label, name, old['wall'], result['wall'], change, flag))
+    return regressions
+
+
+def main(argv=None):
+    global outliers
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(
+            argv, 'hrs:t:n:o:c:',
+            ['help', 'no-real', 'scale=', 'stage=', 'outliers=', 'save=',
+             'compare=', 'tolerance=', 'child='])
+    except getopt.error as msg:
+        usage(1, msg)
+
+    real = 1
+    scales = []
+    stages = []
+    save = None
+    baseline = None
+    tolerance = 20.0
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt == '--child':
+            run_stage_here(arg)
+            return
+        elif opt in ('-r', '--no-real'):
+            real = 0
+        elif opt in ('-s', '--scale'):
+            scales.append(int(arg))
+        elif opt in ('-t', '--stage'):
+            if arg not in STAGE_NAMES:
+                usage(1, 'Error: unknown stage %r' % arg)
+            stages.append(arg)
+        elif opt in ('-n', '--outliers'):
+            outliers = int(arg)
+        elif opt in ('-o', '--save'):
+            save = arg
+        elif opt in ('-c', '--compare'):
+            baseline = arg
+        elif opt == '--tolerance':
+            tolerance = float(arg)
+    if not stages:
+        stages = STAGE_NAMES
+
+    results = {}
+    if real:
+        results['real'] = benchmark('real', None, stages)
+    for scale in scales:
+        label = 'synthetic-%d' % scale
+        results[label] = benchmark(label, scale, stages)
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if baseline:
+        with open(baseline) as f:
+            if compare(results, json.load(f), tolerance):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
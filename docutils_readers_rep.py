@@ -8,9 +8,33 @@ __docformat__ = 'reStructuredText'
 
 
 from docutils.readers import standalone
-from docutils.transforms import frontmatter
+from docutils.transforms import frontmatter, Transformer
 import docutils_transforms_reps as reps
 from docutils.parsers import rst
+from repbuild import timing
+
+
+class TimedTransformer(Transformer):
+
+    """A `Transformer` recording the time each transform takes."""
+
+    def apply_transforms(self):
+        self.document.reporter.attach_observer(
+            self.document.note_transform_message)
+        while self.transforms:
+            if not self.sorted:
+                self.transforms.sort(reverse=True)
+                self.sorted = True
+            priority, transform_class, pending, kwargs = self.transforms.pop()
+            name = 'transform %s.%s' % (
+                transform_class.__module__.split('.')[-1],
+                transform_class.__name__)
+            with timing.stage(name):
+                transform = transform_class(self.document, startnode=pending)
+                transform.apply(**kwargs)
+            self.applied.append((priority, transform_class, pending, kwargs))
+        self.document.reporter.detach_observer(
+            self.document.note_transform_message)
 
 
 class Reader(standalone.Reader):
@@ -45,3 +69,13 @@ class Reader(standalone.Reader):
         if parser is None:
             parser = rst.Parser(rfc2822=1, inliner=self.inliner_class())
         standalone.Reader.__init__(self, parser, '')
+
+    def parse(self):
+        with timing.stage('parser'):
+            standalone.Reader.parse(self)
+
+    def new_document(self):
+        document = standalone.Reader.new_document(self)
+        if timing.recorder is not None:
+            document.transformer = TimedTransformer(document)
+        return document
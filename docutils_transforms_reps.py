@@ -20,6 +20,7 @@ from docutils import nodes, utils, languages
 from docutils import DataError
 from docutils.transforms import Transform
 from docutils.transforms import parts, references, misc
+from rep0.metadata import get_store
 
 
 class Headers(Transform):
@@ -48,28 +49,39 @@ class Headers(Transform):
             raise DataError('Document does not begin with an RFC-2822 '
                             'header; it is not a REP.')
         rep = None
-        for field in header:
-            if field[0].astext().lower() == 'rep':  # should be the first field
-                value = field[1].astext()
-                try:
-                    rep = int(value)
-                    repo_url = self.rep_git_url % rep
-                except ValueError:
-                    rep = value
-                    repo_url = None
-                    msg = self.document.reporter.warning(
-                        '"REP" header must contain an integer; "%s" is an '
-                        'invalid value.' % rep, base_node=field)
-                    msgid = self.document.set_id(msg)
-                    prb = nodes.problematic(value, value or '(none)',
-                                            refid=msgid)
-                    prbid = self.document.set_id(prb)
-                    msg.add_backref(prbid)
-                    if len(field[1]):
-                        field[1][0][:] = [prb]
-                    else:
-                        field[1] += nodes.paragraph('', '', prb)
-                break
+        record = None
+        try:
+            record = get_store().get(self.document['source'])
+        except (KeyError, EnvironmentError, ValueError):
+            pass
+        if record is not None and record['number'] is not None:
+            # The build has already parsed this REP's header.
+            rep = record['number']
+            repo_url = self.rep_git_url % rep
+        else:
+            for field in header:
+                # should be the first field
+                if field[0].astext().lower() == 'rep':
+                    value = field[1].astext()
+                    try:
+                        rep = int(value)
+                        repo_url = self.rep_git_url % rep
+                    except ValueError:
+                        rep = value
+                        repo_url = None
+                        msg = self.document.reporter.warning(
+                            '"REP" header must contain an integer; "%s" is '
+                            'an invalid value.' % rep, base_node=field)
+                        msgid = self.document.set_id(msg)
+                        prb = nodes.problematic(value, value or '(none)',
+                                                refid=msgid)
+                        prbid = self.document.set_id(prb)
+                        msg.add_backref(prbid)
+                        if len(field[1]):
+                            field[1][0][:] = [prb]
+                        else:
+                            field[1] += nodes.paragraph('', '', prb)
+                    break
         if rep is None:
             raise DataError('Document does not contain an RFC-2822 "REP" '
                             'header.')
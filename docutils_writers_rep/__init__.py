@@ -12,19 +12,25 @@ __docformat__ = 'reStructuredText'
 import sys
 import os
 import os.path
+import re
 import codecs
 import docutils
 from docutils import frontend, nodes, utils, writers
 from docutils.writers import html4css1
+from repbuild import assets, mermaid, styles, timing
+from repbuild.template import get_template
 
 
-class Writer(html4css1.Writer):
+# Loaded only by pages that contain mermaid diagrams.  The script is
+# deferred, so it neither blocks parsing nor runs before the diagrams exist.
+MERMAID_HEAD = (
+    '<link rel="stylesheet" type="text/css" charset="utf-8" media="all" '
+    'href="css/mermaid.css">\n'
+    '<script src="mermaid.js" defer '
+    'onload="mermaid.initialize({startOnLoad:true})"></script>')
 
-    default_stylesheet = 'css/rep.css'
 
-    default_stylesheet_path = utils.relative_path(
-        os.path.join(os.getcwd(), 'dummy'),
-        os.path.join(os.path.dirname(__file__), default_stylesheet))
+class Writer(html4css1.Writer):
 
     default_template = 'template.rst'
 
@@ -34,22 +40,27 @@ class Writer(html4css1.Writer):
 
     settings_spec = html4css1.Writer.settings_spec + (
         'REP/HTML-Specific Options',
-        'For the REP/HTML writer, the default value for the --stylesheet-path '
-        'option is "%s", and the default value for --template is "%s". '
+        'For the REP/HTML writer, the default value for --template is "%s". '
+        'Pages load the stylesheet bundle of repbuild.styles, so the '
+        'stylesheet options above have no effect. '
         'See HTML-Specific Options above.'
-        % (default_stylesheet_path, default_template_path),
+        % default_template_path,
         (('ROS\'s home URL.  Default is "https://ros.org".',
           ['--ros-home'],
           {'default': 'https://ros.org', 'metavar': '<URL>'}),
          ('Home URL prefix for REPs.  Default is "." (current directory).',
           ['--rep-home'],
           {'default': '.', 'metavar': '<URL>'}),
+         ('Inline the CSS that styles the top of the page and load the '
+          'stylesheet bundle without blocking rendering.',
+          ['--inline-critical-css'],
+          {'action': 'store_true', 'validator': frontend.validate_boolean}),
          # For testing.
          (frontend.SUPPRESS_HELP,
           ['--no-random'],
           {'action': 'store_true', 'validator': frontend.validate_boolean}),))
 
-    settings_default_overrides = {'stylesheet_path': default_stylesheet_path,
+    settings_default_overrides = {'stylesheet_path': '',
                                   'template': default_template_path,}
 
     relative_path_settings = (html4css1.Writer.relative_path_settings
@@ -62,6 +73,20 @@ class Writer(html4css1.Writer):
         html4css1.Writer.__init__(self)
         self.translator_class = HTMLTranslator
 
+    def translate(self):
+        with timing.stage('translator'):
+            self.visitor = visitor = self.translator_class(self.document)
+            self.document.walkabout(visitor)
+            for attr in self.visitor_attributes:
+                setattr(self, attr, getattr(visitor, attr))
+        with timing.stage('template'):
+            self.output = self.apply_template()
+
+    def apply_template(self):
+        # The compiled template is cached across documents.
+        template = get_template(self.document.settings.template)
+        return template.render(self.interpolation_dict())
+
     def interpolation_dict(self):
         subs = html4css1.Writer.interpolation_dict(self)
         settings = self.document.settings
@@ -87,6 +112,12 @@ class Writer(html4css1.Writer):
             subs['repnum'] = self.repnum
         self.title = header[1][1].astext()
         subs['title'] = self.title
+        # In place of the stylesheets docutils would link.
+        subs['stylesheet'] = styles.head_links(settings.inline_critical_css)
+        if self.visitor.uses_mermaid:
+            subs['mermaid'] = MERMAID_HEAD
+        else:
+            subs['mermaid'] = ''
         subs['body'] = ''.join(
             self.body_pre_docinfo + self.docinfo + self.body)
         return subs
@@ -99,6 +130,75 @@ class Writer(html4css1.Writer):
 
 class HTMLTranslator(html4css1.HTMLTranslator):
 
+    mermaid_pattern = re.compile(
+        r'''class\s*=\s*["'][^"']*\bmermaid\b''')
+
+    def __init__(self, document):
+        html4css1.HTMLTranslator.__init__(self, document)
+        self.uses_mermaid = False
+        """Whether the document contains a mermaid diagram."""
+        self.image_attributes = None
+        """Extra attributes for the <img> tag being written."""
+
+    def emptytag(self, node, tagname, suffix='\n', **attributes):
+        if tagname == 'img' and self.image_attributes:
+            attributes.update(self.image_attributes)
+        return html4css1.HTMLTranslator.emptytag(self, node, tagname, suffix,
+                                                 **attributes)
+
+    def visit_image(self, node):
+        uri = node['uri']
+        asset = None
+        if ':' not in uri:
+            try:
+                asset = assets.publish_image(self.uri2imagepath(uri))
+            except ValueError:
+                pass
+        if asset is None:
+            html4css1.HTMLTranslator.visit_image(self, node)
+            return
+        # Serve the content-hashed copy, and let the browser pick a
+        # variant of the right size and put off loading it until needed.
+        attributes = {'alt': node.get('alt', uri), 'loading': 'lazy'}
+        if asset['srcset']:
+            attributes['srcset'] = ', '.join('%s %dw' % variant
+                                             for variant in asset['srcset'])
+        width, height = asset['width'], asset['height']
+        if width and height and 'scale' not in node and 'height' not in node:
+            # Explicit dimensions let the browser lay out the page before
+            # the image arrives.
+            match = re.match(r'([0-9.]+)(px)?$', node.get('width', ''))
+            if 'width' not in node:
+                attributes['width'] = str(width)
+                attributes['height'] = str(height)
+            elif match:
+                shown = float(match.group(1))
+                attributes['width'] = '%d' % round(shown)
+                attributes['height'] = '%d' % round(shown * height / width)
+                if asset['srcset']:
+                    attributes['sizes'] = '%dpx' % round(shown)
+        self.image_attributes = attributes
+        node['uri'] = asset['url']
+        try:
+            html4css1.HTMLTranslator.visit_image(self, node)
+        finally:
+            node['uri'] = uri
+            self.image_attributes = None
+
+    def visit_raw(self, node):
+        text = node.astext()
+        if ('html' in node.get('format', '').split() and
+                self.mermaid_pattern.search(text)):
+            # Diagrams rendered at build time need no mermaid.js.
+            rendered, pending = mermaid.prerender(text)
+            others = mermaid.DIAGRAM.sub('', text)
+            if pending or self.mermaid_pattern.search(others):
+                self.uses_mermaid = True
+            if rendered != text:
+                node = node.copy()
+                node += nodes.Text(rendered)
+        html4css1.HTMLTranslator.visit_raw(self, node)
+
     def depart_field_list(self, node):
         html4css1.HTMLTranslator.depart_field_list(self, node)
         if 'rfc2822' in node['classes']:
@@ -12,6 +12,10 @@ With the REP information collected, to create the index itself you must:
     2. Format an entry for the REP.
     3. Output the REP (both by category and numerical index).
 
+The same index is also written as JSON (rep-0000.json) and JSON lines
+(rep-0000.ndjson), and with --sqlite=FILE as an SQLite database, for tools
+that want the REP metadata without parsing REP 0 or the REPs themselves.
+
 """
 from __future__ import absolute_import
 from __future__ import print_function
@@ -19,51 +23,77 @@ from __future__ import with_statement
 
 import sys
 import os
-import codecs
+import getopt
 
 from operator import attrgetter
 
-from rep0.output import write_rep0
+from rep0.export import dumps_json, dumps_ndjson, write_sqlite
+from rep0.metadata import get_store
+from rep0.output import render_rep0
 from rep0.rep import REP, REPError
+from repbuild.manifest import atomic_write
 
 
-def main(argv):
-    if not argv[1:]:
-        path = '.'
-    else:
-        path = argv[1]
-
+def load_reps(path):
+    """Return the REPs in the directory (or the single file) `path`, sorted
+    by number."""
     reps = []
     if os.path.isdir(path):
-        for file_path in os.listdir(path):
+        store = get_store()
+        file_paths = sorted(
+            entry.name for entry in os.scandir(path)
+            if entry.name.startswith("rep-") and
+            entry.name.endswith(".rst") and
+            entry.name != 'rep-0000.rst' and entry.is_file())
+        for file_path in file_paths:
             abs_file_path = os.path.join(path, file_path)
-            if not os.path.isfile(abs_file_path):
-                continue
-            if file_path.startswith("rep-") and \
-                    file_path.endswith(".rst") and \
-                    not file_path == 'rep-0000.rst':
-                with codecs.open(
-                        abs_file_path, 'r', encoding='UTF-8') as rep_file:
-                    try:
-                        rep = REP(rep_file)
-                        if rep.number != int(file_path[4:-4]):
-                            raise REPError('REP number does not match file ' +
-                                           'name', file_path, rep.number)
-                        reps.append(rep)
-                    except REPError as e:
-                        errmsg = "Error processing REP %s (%s), excluding:" % \
-                            (e.number, e.filename)
-                        print(errmsg, e, file=sys.stderr)
-                        sys.exit(1)
+            # The store only reads the header block of a REP, and only when
+            # the file changed since the last build.
+            headers = store.get(abs_file_path)['headers']
+            try:
+                rep = REP(abs_file_path, headers)
+                if rep.number != int(file_path[4:-4]):
+                    raise REPError('REP number does not match file ' +
+                                   'name', file_path, rep.number)
+                reps.append(rep)
+            except REPError as e:
+                errmsg = "Error processing REP %s (%s), excluding:" % \
+                    (e.number, e.filename)
+                print(errmsg, e, file=sys.stderr)
+                sys.exit(1)
+        store.save()
         reps.sort(key=attrgetter('number'))
     elif os.path.isfile(path):
         with open(path, 'r') as rep_file:
             reps.append(REP(rep_file))
     else:
         raise ValueError("argument must be a directory or file path")
+    return reps
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv[1:], '', ['sqlite='])
+    except getopt.error as msg:
+        print(msg, file=sys.stderr)
+        sys.exit(2)
+    sqlite_path = None
+    for opt, arg in opts:
+        if opt == '--sqlite':
+            sqlite_path = arg
+    if not args:
+        path = '.'
+    else:
+        path = args[0]
 
-    with codecs.open('rep-0000.rst', 'w', encoding='UTF-8') as rep0_file:
-        write_rep0(reps, rep0_file)
+    reps = load_reps(path)
+    # Written in one go, and renamed into place, so that nothing ever
+    # reads a partial REP 0.
+    atomic_write('rep-0000.rst', render_rep0(reps).encode('utf-8'))
+    atomic_write('rep-0000.json', dumps_json(reps).encode('utf-8'))
+    atomic_write('rep-0000.ndjson', dumps_ndjson(reps).encode('utf-8'))
+    if sqlite_path:
+        write_sqlite(reps, sqlite_path)
 
 if __name__ == "__main__":
     main(sys.argv)
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""A persistent store of what the bodies of the REPs contain.
+
+The body of every REP is read into a record of the REPs it links to and of
+the words in each of its sections, cached in a JSON file like the header
+records of `rep0.metadata`.  Both the link graph (`rep0.links`) and the
+search index (`repbuild.search`) are built from these records, so the
+docutils parser runs once per changed REP for the two of them.
+"""
+from __future__ import absolute_import
+
+import io
+import re
+
+from collections import Counter
+from email.parser import HeaderParser
+
+from docutils import frontend, nodes, utils
+from docutils.parsers import rst
+
+from .metadata import MetadataStore, content_type
+from .rep import read_header
+
+BODY_CACHE = '.rep-body-cache.json'
+
+# Hyperlinks to a REP, relative or on the REP web site.
+REP_URI = re.compile(r'^(?:(?:https?:)?//(?:www\.)?ros\.org/reps/)?'
+                     r'rep-(\d+)\.(?:html|rst|txt)(?:#|$)')
+# What rep2html.fixanchor turns into a link to a REP in plaintext REPs.
+REP_TEXT = re.compile(r'\brep-(\d+)|\bREP\s+(\d+)')
+
+# search.js splits queries into words the same way.
+WORD = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset("""
+    a an and are as at be by for from has have in is it its of on or that
+    the this to was were which will with
+    """.split())
+
+# Nodes whose text is not part of what a reader sees.
+SKIPPED_NODES = (nodes.comment, nodes.system_message, nodes.raw,
+                 nodes.substitution_definition, nodes.target)
+
+_rst_parser = None
+_rst_settings = None
+
+
+def words(text):
+    """Return the indexed words of `text`, in order."""
+    return [word for word in WORD.findall(text.lower())
+            if len(word) > 1 and word not in STOPWORDS]
+
+
+def parse_body(path, text):
+    """Return the doctree of the reStructuredText REP body `text`, as the
+    rst parser alone produces it (no transforms are applied)."""
+    global _rst_parser, _rst_settings
+    if _rst_parser is None:
+        _rst_parser = rst.Parser()
+        _rst_settings = frontend.get_default_settings(rst.Parser)
+        # Only the structure is wanted: stay quiet and touch nothing else.
+        _rst_settings.report_level = 5
+        _rst_settings.halt_level = 5
+        _rst_settings.file_insertion_enabled = 0
+        _rst_settings.raw_enabled = 0
+    document = utils.new_document(path, _rst_settings)
+    _rst_parser.parse(text, document)
+    return document
+
+
+def _section_text(node, parts):
+    for child in node.children:
+        if isinstance(child, (nodes.section,) + SKIPPED_NODES):
+            continue
+        if isinstance(child, nodes.Text):
+            parts.append(child.astext())
+        else:
+            _section_text(child, parts)
+    return parts
+
+
+def _sections(node, anchor, title, out):
+    out.append([anchor, title,
+                dict(Counter(words(' '.join(_section_text(node, [])))))])
+    for child in node.children:
+        if isinstance(child, nodes.section):
+            _sections(child, (child['ids'] or [anchor])[0],
+                      child[0].astext(), out)
+    return out
+
+
+def extract(path):
+    """Read the body of the REP at `path` into a record.
+
+    The record is a dict with the keys ``links``, the sorted numbers of the
+    REPs the body links to, and ``sections``, ``[anchor, title, {word:
+    count}]`` lists, the first one for the text before the first section
+    (with an empty anchor and the REP title, whose words it counts too).
+    """
+    with io.open(path, 'r', encoding='UTF-8') as rep_file:
+        metadata = HeaderParser().parsestr(read_header(rep_file))
+        body = rep_file.read()
+    title = metadata['Title'] or ''
+    targets = set()
+    if content_type(metadata) == 'text/x-rst':
+        document = parse_body(path, body)
+        # Only the parser runs: the header is handled by the metadata
+        # store, and references still carry the URIs they were written
+        # with, on the reference or on its named target.
+        for node in document.findall(nodes.Element):
+            match = REP_URI.match(node.get('refuri', ''))
+            if match:
+                targets.add(int(match.group(1)))
+        sections = _sections(document, '', title, [])
+    else:
+        for match in REP_TEXT.finditer(body):
+            targets.add(int(match.group(1) or match.group(2)))
+        sections = [['', title, dict(Counter(words(body)))]]
+    counts = sections[0][2]
+    for word in words(title):
+        counts[word] = counts.get(word, 0) + 1
+    return {'links': sorted(targets), 'sections': sections}
+
+
+class BodyStore(MetadataStore):
+
+    """Records of the bodies of REP files, cached on disk."""
+
+    extract = staticmethod(extract)
+    version = 1
+
+    def __init__(self, path=BODY_CACHE):
+        MetadataStore.__init__(self, path)
+
+
+_store = None
+
+
+def get_body_store():
+    """Return the body store shared by everything in this process."""
+    global _store
+    if _store is None:
+        _store = BodyStore()
+    return _store
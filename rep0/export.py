@@ -0,0 +1,98 @@
+"""Machine-readable exports of the REP index, alongside REP 0."""
+
+from __future__ import absolute_import
+
+import json
+import os
+import sqlite3
+import tempfile
+
+SCHEMA = """
+CREATE TABLE reps (
+    number INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+CREATE TABLE authors (
+    rep INTEGER NOT NULL REFERENCES reps (number),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    PRIMARY KEY (rep, position)
+);
+CREATE TABLE rep_references (
+    rep INTEGER NOT NULL REFERENCES reps (number),
+    kind TEXT NOT NULL,
+    target INTEGER NOT NULL
+);
+CREATE INDEX rep_references_target ON rep_references (target);
+"""
+
+
+def rep_record(rep):
+    """Return the metadata of `rep` as a dict of JSON types."""
+    return {
+        'number': rep.number,
+        'title': rep.title,
+        'type': rep.type_,
+        'status': rep.status,
+        'authors': [{'name': author.first_last, 'email': author.email}
+                    for author in rep.authors],
+        'requires': rep.requires,
+        'replaces': rep.replaces,
+        'replaced_by': rep.replaced_by,
+        'url': 'rep-%04d.html' % rep.number,
+        }
+
+
+def dumps_json(reps):
+    """Return the index of `reps` as a JSON document."""
+    return json.dumps({'reps': [rep_record(rep) for rep in reps]},
+                      indent=1, sort_keys=True, ensure_ascii=False)
+
+
+def dumps_ndjson(reps):
+    """Return the index of `reps` as JSON lines, one REP per line."""
+    return u''.join(json.dumps(rep_record(rep), sort_keys=True,
+                               ensure_ascii=False) + u'\n'
+                    for rep in reps)
+
+
+def write_sqlite(reps, path):
+    """Write the index of `reps` to a new SQLite database at `path`.
+
+    The database is built next to `path` and renamed over it when done, so
+    readers never see a partial index.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                               suffix='.tmp')
+    os.close(fd)
+    try:
+        db = sqlite3.connect(tmp)
+        try:
+            db.executescript(SCHEMA)
+            for rep in reps:
+                record = rep_record(rep)
+                db.execute('INSERT INTO reps VALUES (?, ?, ?, ?, ?)',
+                           (rep.number, rep.title, rep.type_, rep.status,
+                            record['url']))
+                db.executemany('INSERT INTO authors VALUES (?, ?, ?, ?)',
+                               [(rep.number, position, author['name'],
+                                 author['email'])
+                                for position, author
+                                in enumerate(record['authors'])])
+                db.executemany(
+                    'INSERT INTO rep_references VALUES (?, ?, ?)',
+                    [(rep.number, kind, target)
+                     for kind in ('requires', 'replaces', 'replaced_by')
+                     for target in record[kind]])
+            db.commit()
+        finally:
+            db.close()
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
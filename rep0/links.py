@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""The graph of references between REPs.
+
+Usage: python -m rep0.links [options] [REP ...]
+
+Every REP-to-REP reference is collected in one pass over the REPs: the
+Requires, Replaces and Replaced-By headers, and the links to other REPs
+that `rep0.body` finds in their bodies.  The graph is indexed both ways
+and written to %(LINKS_INDEX)s (by ``make links``).
+
+For each REP given, list the REPs that link to it ("what links here").
+Without REP, list the links to REPs that do not exist, and exit with
+status 1 if there are any.
+
+Options:
+
+-u, --update
+    Rebuild %(LINKS_INDEX)s from the REPs first, instead of reading it.
+
+-w, --warn
+    Report links to REPs that do not exist on stderr, as warnings, and
+    exit with status 0 anyway.
+
+-h, --help
+    Print this help message and exit.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import getopt
+import json
+import os
+import re
+import sys
+
+from repbuild.manifest import atomic_write
+from .body import get_body_store
+from .metadata import get_store
+
+LINKS_INDEX = 'rep-links.json'
+# The headers that reference other REPs, by metadata record key, which is
+# also the kind of their references.
+HEADER_KINDS = ['requires', 'replaces', 'replaced_by']
+
+
+class LinkGraph(object):
+
+    """REP-to-REP references, indexed by source and by target.
+
+    `forward` maps each REP number to its ``(target, kind)`` references,
+    and `reverse` each referenced number to its ``(source, kind)``
+    references.  A kind is ``requires``, ``replaces``, ``replaced_by`` or
+    ``link``.
+    """
+
+    def __init__(self, forward):
+        self.forward = forward
+        self.reverse = {}
+        for source in sorted(forward):
+            for target, kind in forward[source]:
+                self.reverse.setdefault(target, []).append((source, kind))
+
+    def links_from(self, number):
+        return self.forward.get(number, [])
+
+    def links_to(self, number):
+        """Return the ``(source, kind)`` references to REP `number`."""
+        return self.reverse.get(number, [])
+
+    def dangling(self):
+        """Return the ``(source, target, kind)`` references to REPs that
+        do not exist."""
+        return [(source, target, kind)
+                for target in sorted(self.reverse)
+                if target not in self.forward
+                for source, kind in self.reverse[target]]
+
+    def save(self, path=LINKS_INDEX):
+        data = {
+            'forward': dict((str(source), edges)
+                            for source, edges in self.forward.items()),
+            'reverse': dict((str(target), edges)
+                            for target, edges in self.reverse.items()),
+            'dangling': self.dangling(),
+            }
+        atomic_write(path, json.dumps(data, sort_keys=True)
+                     .encode('utf-8'))
+
+    @classmethod
+    def load(cls, path=LINKS_INDEX):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(dict((int(source), [tuple(edge) for edge in edges])
+                        for source, edges in data['forward'].items()))
+
+
+def build_graph(path='.'):
+    """Return the `LinkGraph` of the REPs in the directory `path`."""
+    store = get_store()
+    body_store = get_body_store()
+    forward = {}
+    for name in sorted(os.listdir(path)):
+        if (not re.match(r'rep-\d+\.rst$', name) or
+                name == 'rep-0000.rst'):
+            continue
+        rep_path = os.path.join(path, name)
+        record = store.get(rep_path)
+        number = record['number']
+        if number is None:
+            continue
+        edges = []
+        for kind in HEADER_KINDS:
+            edges.extend((target, kind) for target in record[kind])
+        edges.extend((target, 'link')
+                     for target in body_store.get(rep_path)['links'])
+        forward[number] = [edge for index, edge in enumerate(edges)
+                           if edge[0] != number and edge not in edges[:index]]
+    store.save()
+    body_store.save()
+    return LinkGraph(forward)
+
+
+def usage(code, msg=''):
+    """Print usage message and exit.  Uses stderr if code != 0."""
+    if code == 0:
+        out = sys.stdout
+    else:
+        out = sys.stderr
+    print(__doc__ % globals(), file=out)
+    if msg:
+        print(msg, file=out)
+    sys.exit(code)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(argv, 'uwh', ['update', 'warn', 'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+    update = not os.path.exists(LINKS_INDEX)
+    warn = False
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-u', '--update'):
+            update = True
+        elif opt in ('-w', '--warn'):
+            warn = True
+    try:
+        numbers = [int(arg.lower().replace('rep-', '').split('.')[0])
+                   for arg in args]
+    except ValueError:
+        usage(1, 'Error: expected REP numbers, not %r' % args)
+
+    if update:
+        graph = build_graph()
+        graph.save()
+    else:
+        graph = LinkGraph.load()
+    for number in numbers:
+        for source, kind in graph.links_to(number):
+            print('REP %d: REP %d (%s)' % (number, source, kind))
+    if not numbers:
+        dangling = graph.dangling()
+        for source, target, kind in dangling:
+            if warn:
+                print('Warning: REP %d: %s: REP %d does not exist'
+                      % (source, kind, target), file=sys.stderr)
+            else:
+                print('REP %d: %s: REP %d does not exist'
+                      % (source, kind, target))
+        if dangling and not warn:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
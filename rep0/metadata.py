@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""A persistent store of parsed REP headers, shared by the whole build.
+
+The header of every REP is parsed into a compact record once and cached in
+a JSON file, keyed by a hash of the REP source.  rep2html, genrepindex and
+the docutils transforms all read their REP metadata from here, so a full
+build parses each header exactly once, and an unchanged REP not at all.
+"""
+from __future__ import absolute_import
+
+import io
+import json
+import os
+
+from email.parser import HeaderParser
+
+from repbuild.manifest import atomic_write, file_digest
+from .rep import read_header, rep_numbers
+
+METADATA_CACHE = '.rep-metadata.json'
+
+# Bump whenever the layout of a record changes, to invalidate old caches.
+RECORD_VERSION = 1
+
+
+def content_type(metadata):
+    """Return the content type of a REP from its parsed header `metadata`,
+    or None if it is not a REP at all."""
+    if metadata['Content-Type'] is not None:
+        return (metadata['Content-Type'].split() or
+                ['text/plain'])[0].lower()
+    elif metadata['REP'] is not None:
+        return 'text/plain'
+    return None
+
+
+def extract(path):
+    """Parse the header of the REP at `path` into a metadata record.
+
+    The record is a dict with the keys ``number`` (an int, or None if the
+    REP header is not an integer), ``title``, ``type``, ``status``,
+    ``authors`` (the raw Author header), ``requires``, ``replaces`` and
+    ``replaced_by`` (lists of REP numbers), ``content_type`` (None if the
+    file is not a REP at all) and ``headers``, the list of all
+    ``[name, value]`` header pairs in file order.
+    """
+    with io.open(path, 'r', encoding='UTF-8') as rep_file:
+        metadata = HeaderParser().parsestr(read_header(rep_file))
+    headers = [[name, value] for name, value in metadata.items()]
+    try:
+        number = int(metadata['REP'])
+    except (TypeError, ValueError):
+        number = None
+    return {
+        'number': number,
+        'title': metadata['Title'],
+        'type': metadata['Type'],
+        'status': metadata['Status'],
+        'authors': metadata['Author'],
+        'requires': rep_numbers(metadata['Requires']),
+        'replaces': rep_numbers(metadata['Replaces']),
+        'replaced_by': rep_numbers(metadata['Replaced-By']),
+        'content_type': content_type(metadata),
+        'headers': headers,
+        }
+
+
+class MetadataStore(object):
+
+    """Metadata records for REP files, cached on disk.
+
+    A record is reused while the file's size and modification time are
+    unchanged; otherwise the file is hashed, and only re-parsed if its
+    content actually changed.
+
+    Subclasses may cache other per-REP records by overriding `extract`
+    and `version`.
+    """
+
+    extract = staticmethod(extract)
+    version = RECORD_VERSION
+
+    def __init__(self, path=METADATA_CACHE):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+            if cache.get('version') == self.version:
+                self.entries = cache['reps']
+        except (IOError, OSError, ValueError, AttributeError):
+            pass
+
+    def get(self, rep_path):
+        """Return the metadata record for the REP file at `rep_path`."""
+        name = os.path.normpath(rep_path)
+        stat = os.stat(rep_path)
+        stamp = [stat.st_size, stat.st_mtime]
+        entry = self.entries.get(name)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry['record']
+        digest = file_digest(rep_path)
+        if entry is None or entry['digest'] != digest:
+            entry = {'digest': digest, 'record': self.extract(rep_path)}
+        entry['stamp'] = stamp
+        self.entries[name] = entry
+        self.dirty = True
+        return entry['record']
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = json.dumps({'version': self.version, 'reps': self.entries},
+                          sort_keys=True)
+        atomic_write(self.path, data.encode('utf-8'))
+        self.dirty = False
+
+
+_store = None
+
+
+def get_store():
+    """Return the metadata store shared by everything in this process."""
+    global _store
+    if _store is None:
+        _store = MetadataStore()
+    return _store
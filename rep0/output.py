@@ -4,7 +4,6 @@ from __future__ import print_function
 
 import datetime
 import sys
-import unicodedata
 
 from operator import attrgetter
 
@@ -15,15 +14,21 @@ from .rep import REP, REPError
 indent = u' '
 
 
-def write_column_headers(output):
-    """Output the column headers for the REP indices."""
+def column_headers():
+    """Return the column header lines of the REP indices."""
     column_headers = {'status': u'', 'type': u'', 'number': u'num',
                       'title': u'title', 'authors': u'owner'}
-    print(constants.column_format % column_headers, file=output)
     underline_headers = {}
     for key, value in column_headers.items():
         underline_headers[key] = u'%s' % (len(value) * u'-')
-    print(constants.column_format % underline_headers, file=output)
+    return [constants.column_format % column_headers,
+            constants.column_format % underline_headers]
+
+
+def write_column_headers(output):
+    """Output the column headers for the REP indices."""
+    for line in column_headers():
+        print(line, file=output)
 
 
 def sort_reps(reps):
@@ -63,31 +68,23 @@ def sort_reps(reps):
 
 
 def verify_email_addresses(reps):
+    # The email addresses seen for each author (equal by name).
     authors_dict = {}
     for rep in reps:
         for author in rep.authors:
-            # If this is the first time we have come across an author, add him.
-            if author not in authors_dict:
-                authors_dict[author] = [author.email]
-            else:
-                found_emails = authors_dict[author]
-                # If no email exists for the author, use the new value.
-                if not found_emails[0]:
-                    authors_dict[author] = [author.email]
-                # If the new email is an empty string, move on.
-                elif not author.email:
-                    continue
-                # If the email has not been seen, add it to the list.
-                elif author.email not in found_emails:
-                    authors_dict[author].append(author.email)
+            emails = authors_dict.get(author)
+            if emails is None:
+                emails = authors_dict[author] = set()
+            if author.email:
+                emails.add(author.email)
 
     valid_authors_dict = {}
     too_many_emails = []
     for author, emails in authors_dict.items():
         if len(emails) > 1:
-            too_many_emails.append((author.first_last, emails))
+            too_many_emails.append((author.first_last, sorted(emails)))
         else:
-            valid_authors_dict[author] = emails[0]
+            valid_authors_dict[author] = emails.pop() if emails else ''
     if too_many_emails:
         err_output = []
         for author, emails in too_many_emails:
@@ -106,95 +103,62 @@ def sort_authors(authors_dict):
 
 
 def normalized_last_first(name):
-    return len(unicodedata.normalize('NFC', name.last_first))
+    return name.last_first_width
 
 
-def write_rep0(reps, output=sys.stdout):
+def render_rep0(reps):
+    """Return the text of REP 0 for `reps`, sorted by number."""
+    # Each REP's row is formatted once, although it is listed twice.
+    rows = dict((rep.number, u'%s' % rep) for rep in reps)
     today = datetime.date.today().strftime("%Y-%m-%d")
-    print(constants.header % today, file=output)
-    print('', file=output)
-    print(u"Introduction", file=output)
-    print(constants.intro, file=output)
-    print('', file=output)
-    print(u"Index by Category", file=output)
-    print('', file=output)
-    write_column_headers(output)
-    meta, info, accepted, open_, finished, dead = sort_reps(reps)
-    print('', file=output)
-    print(u" Meta-REPs (REPs about REPs or Processes)", file=output)
-    print('', file=output)
-    for rep in meta:
-        print(u'%s' % rep, file=output)
-    print('', file=output)
-    print(u" Other Informational REPs", file=output)
-    print('', file=output)
-    for rep in info:
-        print(u'%s' % rep, file=output)
-    print('', file=output)
-    print(u" Accepted REPs (accepted; may not be implemented yet)",
-          file=output)
-    print('', file=output)
-    for rep in accepted:
-        print(u'%s' % rep, file=output)
-    print('', file=output)
-    print(u" Open REPs (under consideration)", file=output)
-    print('', file=output)
-    for rep in open_:
-        print(u'%s' % rep, file=output)
-    print('', file=output)
-    print(u" Finished REPs (done, implemented in code repository)",
-          file=output)
-    print('', file=output)
-    for rep in finished:
-        print(u'%s' % rep, file=output)
-    print('', file=output)
-    print(u" Deferred, Abandoned, Withdrawn, and Rejected REPs", file=output)
-    print('', file=output)
-    for rep in dead:
-        print(u'%s' % rep, file=output)
-    print('', file=output)
-    print('', file=output)
-    print(u" Numerical Index", file=output)
-    print('', file=output)
-    write_column_headers(output)
+    lines = [constants.header % today, u'',
+             u"Introduction", constants.intro, u'',
+             u"Index by Category", u'']
+    lines.extend(column_headers())
+    categories = zip(
+        [u" Meta-REPs (REPs about REPs or Processes)",
+         u" Other Informational REPs",
+         u" Accepted REPs (accepted; may not be implemented yet)",
+         u" Open REPs (under consideration)",
+         u" Finished REPs (done, implemented in code repository)",
+         u" Deferred, Abandoned, Withdrawn, and Rejected REPs"],
+        sort_reps(reps))
+    for title, category in categories:
+        lines.extend([u'', title, u''])
+        lines.extend(rows[rep.number] for rep in category)
+    lines.extend([u'', u'', u" Numerical Index", u''])
+    lines.extend(column_headers())
     prev_rep = 0
     for rep in reps:
         if rep.number - prev_rep > 1:
-            print('', file=output)
-        print(u'%s' % rep, file=output)
+            lines.append(u'')
+        lines.append(rows[rep.number])
         prev_rep = rep.number
-    print('', file=output)
-    print('', file=output)
-    print(u"Key", file=output)
-    print('', file=output)
+    lines.extend([u'', u'', u"Key", u''])
     for type_ in REP.type_values:
-        print(u"    %s - %s REP" % (type_[0], type_), file=output)
-    print('', file=output)
+        lines.append(u"    %s - %s REP" % (type_[0], type_))
+    lines.append(u'')
     for status in REP.status_values:
-        print(u"    %s - %s proposal" % (status[0], status), file=output)
+        lines.append(u"    %s - %s proposal" % (status[0], status))
 
-    print('', file=output)
-    print('', file=output)
-    print(u"Owners", file=output)
-    print('', file=output)
+    lines.extend([u'', u'', u"Owners", u''])
     authors_dict = verify_email_addresses(reps)
     max_name = max(list(authors_dict.keys()), key=normalized_last_first)
     max_name_len = len(max_name.last_first)
-    print(u"    %s  %s" % ('name'.ljust(max_name_len), 'email address'),
-          file=output)
-    print(u"    %s  %s" %
-          ((len('name')*'-').ljust(max_name_len), len('email address')*'-'),
-          file=output)
+    lines.append(u"    %s  %s" % ('name'.ljust(max_name_len),
+                                   'email address'))
+    lines.append(u"    %s  %s" % ((len('name')*'-').ljust(max_name_len),
+                                   len('email address')*'-'))
     sorted_authors = sort_authors(authors_dict)
     for author in sorted_authors:
         # Use the email from authors_dict instead of the one from 'author' as
         # the author instance may have an empty email.
-        print(u"    %s  %s" %
-              (author.last_first.ljust(max_name_len), authors_dict[author]),
-              file=output)
-    print('', file=output)
-    print('', file=output)
-    print(u"References", file=output)
-    print('', file=output)
-    print(constants.references, file=output)
-    print(constants.footer, file=output)
+        lines.append(u"    %s  %s" % (author.last_first.ljust(max_name_len),
+                                       authors_dict[author]))
+    lines.extend([u'', u'', u"References", u'',
+                  constants.references, constants.footer])
+    return u'\n'.join(lines) + u'\n'
+
+
+def write_rep0(reps, output=sys.stdout):
+    output.write(render_rep0(reps))
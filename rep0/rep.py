@@ -4,11 +4,34 @@ import re
 import textwrap
 import unicodedata
 
+from email.message import Message
 from email.parser import HeaderParser
 
 from . import constants
 
 
+def read_header(rep_file):
+    """Return the RFC 2822 header block at the start of `rep_file`.
+
+    Reading stops at the first blank line, so the (possibly large) body of
+    the REP is never read.
+    """
+    lines = []
+    for line in rep_file:
+        if not line.rstrip('\r\n'):
+            break
+        lines.append(line)
+    return u''.join(lines)
+
+
+def rep_numbers(value):
+    """Return the REP numbers listed in a header such as Requires."""
+    if not value:
+        return []
+    return [int(part) for part in re.split(r',?\s+', value.strip())
+            if part.isdigit()]
+
+
 class REPError(Exception):
 
     def __init__(self, error, rep_file, rep_number=None):
@@ -56,8 +79,18 @@ class Author(object):
 
         + email : str
             The author's email address.
+
+        + last_first_width : int
+            The length of `last_first` once NFC normalized.
+
+    Use `get_author` rather than creating authors directly: it returns the
+    same instance for every REP by the same author, so the sort key and
+    normalized name of an author are only ever computed once.
     """
 
+    __slots__ = ('first_last', 'email', 'first', 'last', 'suffix',
+                 'last_first', 'nick', 'last_first_width', '_sort_by')
+
     def __init__(self, author_and_email_tuple):
         """Parse the name and email address of an author."""
         name, email = author_and_email_tuple
@@ -75,6 +108,9 @@ class Author(object):
             if self.suffix:
                 self.last_first += u', ' + self.suffix
         self.nick = self.last
+        self.last_first_width = len(
+            unicodedata.normalize('NFC', self.last_first))
+        self._sort_by = None
 
     def __hash__(self):
         return hash(self.first_last)
@@ -84,6 +120,11 @@ class Author(object):
 
     @property
     def sort_by(self):
+        if self._sort_by is None:
+            self._sort_by = self._sort_key()
+        return self._sort_by
+
+    def _sort_key(self):
         name_parts = self.last.split()
         for index, part in enumerate(name_parts):
             if part[0].isupper():
@@ -118,6 +159,19 @@ class Author(object):
                 return name_parts[-1], suffix
 
 
+_authors = {}
+
+
+def get_author(author_and_email_tuple):
+    """Return the `Author` for a ``(name, email)`` pair, shared by every
+    REP of the index build."""
+    author = _authors.get(author_and_email_tuple)
+    if author is None:
+        author = _authors[author_and_email_tuple] = Author(
+            author_and_email_tuple)
+    return author
+
+
 class REP(object):
 
     """Representation of REPs.
@@ -139,6 +193,10 @@ class REP(object):
 
         + authors : Sequence(Author)
             A list of the authors.
+
+        + requires, replaces, replaced_by : Sequence(int)
+            The numbers of the REPs listed in the Requires, Replaces and
+            Replaced-By headers.
     """
 
     # The various RFC 822 headers that are supported.
@@ -159,12 +217,24 @@ class REP(object):
     status_values = (u"Accepted", u"Rejected", u"Withdrawn", u"Deferred",
                      u"Final", u"Active", u"Draft", u"Replaced")
 
-    def __init__(self, rep_file):
-        """Init object from an open REP file object."""
+    def __init__(self, rep_file, headers=None):
+        """Init object from an open REP file object.
+
+        Only the header block is read from `rep_file`; the file is left
+        positioned at the start of the REP body.  If the ``(name, value)``
+        header pairs have already been parsed (see rep0.metadata), pass them
+        as `headers` and `rep_file` may simply be the file name.
+        """
         # Parse the headers.
         self.filename = rep_file
-        rep_parser = HeaderParser()
-        metadata = rep_parser.parse(rep_file)
+        if headers is None:
+            rep_parser = HeaderParser()
+            metadata = rep_parser.parsestr(read_header(rep_file))
+        else:
+            metadata = Message()
+            for name, value in headers:
+                metadata[name] = value
+        filename = getattr(rep_file, 'name', rep_file)
         header_order = iter(self.headers)
         try:
             for header_name in metadata.keys():
@@ -175,49 +245,53 @@ class REP(object):
                     raise REPError("did not deal with "
                                    "%r before having to handle %r" %
                                    (header_name, current_header),
-                                   rep_file.name)
+                                   filename)
         except StopIteration:
-            raise REPError("headers missing or out of order", rep_file.name)
+            raise REPError("headers missing or out of order", filename)
         required = False
         try:
             while not required:
                 current_header, required = next(header_order)
             else:
                 raise REPError("REP is missing its %r" % (current_header,),
-                               rep_file.name)
+                               filename)
         except StopIteration:
             pass
         # 'REP'.
         try:
             self.number = int(metadata['REP'])
         except ValueError:
-            raise REPParseError("REP number isn't an integer", rep_file.name)
+            raise REPParseError("REP number isn't an integer", filename)
         # 'Title'.
         self.title = metadata['Title']
         # 'Type'.
         type_ = metadata['Type']
         if type_ not in self.type_values:
             raise REPError('%r is not a valid Type value' % (type_,),
-                           rep_file.name, self.number)
+                           filename, self.number)
         self.type_ = type_
         # 'Status'.
         status = metadata['Status']
         if status not in self.status_values:
             raise REPError("%r is not a valid Status value" %
-                           (status,), rep_file.name, self.number)
+                           (status,), filename, self.number)
         # Special case for Active REPs.
         if (status == u"Active" and
                 self.type_ not in ("Process", "Informational")):
             raise REPError("Only Process and Informational REPs may "
-                           "have an Active status", rep_file.name,
+                           "have an Active status", filename,
                            self.number)
         self.status = status
         # 'Author'.
         authors_and_emails = self._parse_author(metadata['Author'])
         if len(authors_and_emails) < 1:
-            raise REPError("no authors found", rep_file.name,
+            raise REPError("no authors found", filename,
                            self.number)
-        self.authors = [Author(x) for x in authors_and_emails]
+        self.authors = [get_author(x) for x in authors_and_emails]
+        # 'Requires', 'Replaces', 'Replaced-By'.
+        self.requires = rep_numbers(metadata['Requires'])
+        self.replaces = rep_numbers(metadata['Replaces'])
+        self.replaced_by = rep_numbers(metadata['Replaced-By'])
 
     def _parse_author(self, data):
         """Return a list of author names and emails."""
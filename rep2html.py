@@ -17,9 +17,11 @@ Options:
 
 -i, --install
     After generating the HTML, install it and the plaintext source file
-    (.rst) on python.org.  In that case the user's name is used in the scp
-    and ssh commands, unless "-u username" is given (in which case, it is
-    used instead).  Without -i, -u is ignored.
+    (.rst) on python.org, with the stylesheet bundle and the published
+    images the pages link to.  In that case the user's name is used in the
+    rsync command, unless "-u username" is given (in which case, it is
+    used instead).  Without -i, -u is ignored.  Only files whose content
+    changed since the last install are sent, -j transfers at a time.
 
 -l, --local
     Same as -i/--install, except install on the local machine.  Use this
@@ -28,6 +30,45 @@ Options:
 -q, --quiet
     Turn off verbose messages.
 
+-j N, --jobs=N
+    Render the REPs in N worker processes.  Messages are still reported
+    in input order and the output is identical to a serial build.
+
+-f, --force
+    Rebuild every REP, even those the build manifest records as up to
+    date.  The manifest (%(BUILD_MANIFEST)s) keys each REP on a hash of
+    its source and of everything else that goes into its HTML.  reST REPs
+    are also read again rather than taken from the doctree cache
+    (%(DOCTREE_CACHE)s/); as Docutils reports its warnings about a REP
+    while reading it, this is how to see them again.
+
+--profile
+    Time every stage of rendering each REP -- the parser, each docutils
+    transform, the writer's translator and the template -- and print a
+    per-REP, per-stage table.  Implies --force and a serial build, so
+    every REP is parsed and transformed again.
+
+--profile-trace=FILE
+    Like --profile, but write the timings to FILE as a Chrome trace
+    (for chrome://tracing or https://ui.perfetto.dev) instead.
+
+-w, --watch
+    Keep running, and re-render REPs as they are edited: a changed REP
+    source or asset directory (rep-NNNN/) re-renders that REP, and a
+    changed rep-html-template or css/ file re-renders whatever depends on
+    it.  When a REP's header changes, rep-0000.rst is regenerated too.
+    Uses inotify (the inotify_simple module) when available, and polls
+    otherwise.  Bursts of saves are collapsed into a single rebuild.
+
+--serve
+    Run as a build server: read one JSON request per line from stdin and
+    write one JSON response per line to stdout.  Docutils and its settings
+    are loaded once, so each render costs only the REP itself.  A request
+    looks like {"rep": "12"} (a rep number or .rst file, as on the command
+    line, plus an optional "id" echoed back); the response carries "html"
+    (the file written, or null), "messages" and "errors".  -q leaves the
+    progress lines out of the messages, and -f reads every REP anew.
+
 -h, --help
     Print this help message and exit.
 
@@ -43,7 +84,15 @@ import html
 import glob
 import getopt
 import errno
+import io
 import time
+import multiprocessing
+import subprocess
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 REQUIRES = {'python': '2.2',
             'docutils': '0.2.7'}
@@ -54,6 +103,9 @@ REPGITURL = (
     'https://github.com/ros-infrastructure/rep/blob/master/rep-%04d.rst')
 REPDIRRUL = 'http://www.ros.org/reps/'
 
+WATCH_INTERVAL = 0.5    # seconds between polls, without inotify
+WATCH_DEBOUNCE = 0.3    # seconds of quiet before rebuilding
+
 HOST = "wgs32.willowgarage.com"                    # host for update
 HDIR = "/var/www/www.ros.org/html/reps"  # target host directory
 LOCALVARS = "Local Variables:"
@@ -69,11 +121,28 @@ to templates.  DO NOT USE THIS HTML FILE AS YOUR TEMPLATE!
 DTD = ('<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 4.0 Transitional//EN"\n'
        '                      "http://www.w3.org/TR/REC-html40/loose.dtd">')
 
+# Matches only the tokens fixanchor() may link; the text between them is
+# escaped in bulk by fixlinks().
 fixpat = re.compile(
     r"((https?|ftp):[-_a-zA-Z0-9/.+~:?#$=&,]+)|(rep-\d+(.rst)?)|"
     r"(RFC[- ]?(?P<rfcnum>\d+))|"
-    r"(REP\s+(?P<repnum>\d+))|"
-    ".")
+    r"(REP\s+(?P<repnum>\d+))")
+
+# The images a reST REP shows, which the writer publishes under the hash of
+# their content (see repbuild.assets); also in substitution definitions.
+IMAGE_DIRECTIVE = re.compile(
+    r'^[ \t]*\.\.[ \t]+(?:\|[^|]+\|[ \t]+)?(?:image|figure)::[ \t]*(\S+)',
+    re.M)
+
+BUILD_MANIFEST = '.rep2html-manifest.json'
+# Files, besides the REP itself, that the HTML of each REP type depends on.
+BUILD_INPUTS = {
+    # docutils.conf holds the inline-critical-css setting (page_stylesheet).
+    'text/plain': ['rep-html-template', 'docutils.conf', __file__],
+    'text/x-rst': ['rep-html-template', 'docutils.conf'],
+    }
+# Files the cached doctree of a reST REP depends on (see repbuild.doctree).
+READ_INPUTS = ['docutils.conf']
 
 EMPTYSTRING = ''
 SPACE = ' '
@@ -85,10 +154,39 @@ COMMASPACE = ', '
 import docutils.readers
 import docutils.writers
 import docutils_readers_rep
+import docutils_transforms_reps
 import docutils_writers_rep
 sys.modules['docutils.readers.rep'] = docutils_readers_rep
 sys.modules['docutils.writers.rep_html'] = docutils_writers_rep
 
+import rep0.metadata
+import repbuild.assets
+import repbuild.doctree
+import repbuild.mermaid
+import repbuild.styles
+import repbuild.template
+from rep0.metadata import get_store
+from repbuild import timing
+from repbuild.deploy import deploy, site_files
+from repbuild.manifest import Manifest, digest, file_digest
+from repbuild.template import get_template
+
+BUILD_INPUTS['text/x-rst'].extend(
+    os.path.splitext(module.__file__)[0] + '.py'
+    for module in (docutils_readers_rep, docutils_transforms_reps,
+                   docutils_writers_rep, repbuild.assets, repbuild.doctree,
+                   repbuild.mermaid))
+# The doctree is cached after the writer's transforms have run too.
+READ_INPUTS.extend(
+    os.path.splitext(module.__file__)[0] + '.py'
+    for module in (docutils_readers_rep, docutils_transforms_reps,
+                   docutils_writers_rep, rep0.metadata, repbuild.doctree))
+for inputs in BUILD_INPUTS.values():
+    inputs.extend(os.path.splitext(module.__file__)[0] + '.py'
+                  for module in (rep0.metadata, repbuild.styles,
+                                 repbuild.template))
+    inputs.extend(path for path, media in repbuild.styles.BUNDLE_SOURCES)
+
 
 def usage(code, msg=''):
     """Print usage message and exit.  Uses stderr if code != 0."""
@@ -96,7 +194,9 @@ def usage(code, msg=''):
         out = sys.stdout
     else:
         out = sys.stderr
-    print(__doc__ % globals(), file=out)
+    print(__doc__ % dict(globals(),
+                         DOCTREE_CACHE=repbuild.doctree.DOCTREE_CACHE),
+          file=out)
     if msg:
         print(msg, file=out)
     sys.exit(code)
@@ -125,7 +225,20 @@ def fixanchor(current, match):
         link = RFCURL % rfcnum
     if link:
         return '<a href="%s">%s</a>' % (html.escape(link), html.escape(text))
-    return html.escape(match.group(0))  # really slow, but it works...
+    return html.escape(text)
+
+
+def fixlinks(current, text):
+    """HTML-escape `text`, turning URLs and REP and RFC references into
+    links.  `current` is the REP file being converted."""
+    parts = []
+    pos = 0
+    for match in fixpat.finditer(text):
+        parts.append(html.escape(text[pos:match.start()]))
+        parts.append(fixanchor(current, match))
+        pos = match.end()
+    parts.append(html.escape(text[pos:]))
+    return EMPTYSTRING.join(parts)
 
 
 NON_MASKED_EMAILS = [
@@ -162,23 +275,15 @@ def fixfile(inpath, input_lines, outfile):
         print(COMMENT, file=outfile)
         print('<head>', file=outfile)
     # head
-    header = []
-    rep = ""
-    title = ""
     for line in infile:
         if not line.strip():
             break
-        if line[0].strip():
-            if ":" not in line:
-                break
-            key, value = line.split(":", 1)
-            value = value.strip()
-            header.append((key, value))
-        else:
-            # continuation line
-            key, value = header[-1]
-            value = value + line
-            header[-1] = key, value
+    header = []
+    rep = ""
+    title = ""
+    for key, value in get_store().get(inpath)['headers']:
+        value = value.strip()
+        header.append((key, value))
         if key.lower() == "title":
             title = value
         elif key.lower() == "rep":
@@ -187,9 +292,7 @@ def fixfile(inpath, input_lines, outfile):
         title = "REP " + rep + " -- " + title
 
     # remove nav to rep index
-    f = open('rep-html-template', 'r')
-    tmpl = f.read()
-    f.close()
+    tmpl = get_template('rep-html-template')
     if int(rep) == 0:
         tmpl = tmpl.replace(
             '[<b><a href="%(repindex)s">REP Index</a></b>]', '')
@@ -201,16 +304,13 @@ def fixfile(inpath, input_lines, outfile):
         'encoding': 'utf-8',
         'version': '',
         'title': 'REP '+rep+" -- "+title,
-        'stylesheet': (
-            '<link rel="stylesheet" href="css/rep.css" type="text/css" />'),
+        'stylesheet': page_stylesheet(),
+        # Plaintext REPs have no mermaid diagrams.
+        'mermaid': '',
         }
 
     real_outfile = outfile
 
-    try:
-        from cStringIO import StringIO
-    except ImportError:
-        from io import StringIO
     outfile = StringIO()
     print("""<div class="header">
 <table border="0" class="rfc2822 docutils field-list" frame="void" rules="none">
@@ -299,7 +399,7 @@ def fixfile(inpath, input_lines, outfile):
                     print(re.sub(
                         parts[-1], url, line.rstrip(), 1), file=outfile)
                     continue
-            line = fixpat.sub(lambda x, c=inpath: fixanchor(c, x), line)
+            line = fixlinks(inpath, line)
             if need_pre:
                 print('<pre>', file=outfile)
                 need_pre = 0
@@ -310,50 +410,81 @@ def fixfile(inpath, input_lines, outfile):
     print('</div>', file=outfile)
 
     tmpl_vars['body'] = outfile.getvalue()
-    real_outfile.write((tmpl % tmpl_vars).encode('utf'))
+    real_outfile.write(tmpl.render(tmpl_vars).encode('utf'))
     if 0:
         print('</body>', file=outfile)
         print('</html>', file=outfile)
 
 docutils_settings = None
 """Runtime settings object used by Docutils.  Can be set by the client
-application when this module is imported."""
+application when this module is imported, and is otherwise built from
+docutils.conf the first time a reST REP is rendered.  Each REP is
+rendered with a shallow copy, so the object itself is never modified."""
 
 
-def fix_rst_rep(inpath, input_lines, outfile):
+def make_docutils_settings():
+    """Build the settings REPs are rendered with, reading docutils.conf.
+
+    This is the expensive part of setting up a Docutils publisher; assign
+    the result to `docutils_settings` to pay for it only once.
+    """
     from docutils import core
-    output = core.publish_string(
-        source=''.join(input_lines),
-        source_path=inpath,
-        destination_path=outfile.name,
-        reader_name='rep',
-        parser_name='restructuredtext',
-        writer_name='rep_html',
-        settings=docutils_settings,
-        # Allow Docutils traceback if there's an exception:
-        settings_overrides={'traceback': 1})
-    outfile.write(output)
+    publisher = core.Publisher()
+    publisher.set_components('rep', 'restructuredtext', 'rep_html')
+    # Allow Docutils traceback if there's an exception:
+    return publisher.get_settings(traceback=1)
 
 
-def get_rep_type(input_lines):
-    """
-    Return the Content-Type of the input.  "text/plain" is the default.
+use_doctree_cache = True
+"""Whether reST REPs may be written from their cached doctree instead of
+being read again (see repbuild.doctree).  Off with --force."""
+
+
+def get_docutils_settings():
+    """Return `docutils_settings`, building it on first use."""
+    global docutils_settings
+    if docutils_settings is None:
+        docutils_settings = make_docutils_settings()
+    return docutils_settings
+
+
+def page_stylesheet():
+    """Return the <head> markup that loads the stylesheet bundle, for pages
+    not written by the REP writer, following the same inline-critical-css
+    setting as the pages it writes."""
+    return repbuild.styles.head_links(
+        get_docutils_settings().inline_critical_css)
 
-    Return ``None`` if the input is not a REP.
-    """
-    rep_type = None
-    for line in input_lines:
-        line = line.rstrip().lower()
-        if not line:
-            # End of the RFC 2822 header (first blank line).
-            break
-        elif line.startswith('content-type: '):
-            rep_type = line.split()[1] or 'text/plain'
-            break
-        elif line.startswith('rep: '):
-            # Default REP type, used if no explicit content-type specified:
-            rep_type = 'text/plain'
-    return rep_type
+
+def fix_rst_rep(inpath, input_lines, outfile):
+    from docutils import core, io
+    # Reading docutils.conf and building the option parser happen once per
+    # run, in get_docutils_settings(), rather than once per REP.
+    publisher = core.Publisher(settings=get_docutils_settings().copy(),
+                               source_class=io.StringInput,
+                               destination_class=io.StringOutput)
+    publisher.set_components('rep', 'restructuredtext', 'rep_html')
+    source = ''.join(input_lines)
+    publisher.set_source(source, inpath)
+    publisher.set_destination(None, outfile.name)
+    # Only the writer runs for a REP whose doctree is cached.
+    key = doctree_key(inpath, source)
+    document = None
+    # Profiling times reading as well.
+    if use_doctree_cache and timing.recorder is None:
+        with timing.stage('doctree cache'):
+            document = repbuild.doctree.load(inpath, key,
+                                             publisher.settings)
+    if document is None:
+        document = publisher.reader.read(
+            publisher.source, publisher.parser, publisher.settings)
+        publisher.document = document
+        publisher.apply_transforms()
+        with timing.stage('doctree cache'):
+            repbuild.doctree.save(inpath, key, document)
+    output = publisher.writer.write(document, publisher.destination)
+    publisher.writer.assemble_parts()
+    outfile.write(output)
 
 
 def get_input_lines(inpath):
@@ -382,7 +513,7 @@ def make_html(inpath, verbose=0):
     input_lines = get_input_lines(inpath)
     if input_lines is None:
         return None
-    rep_type = get_rep_type(input_lines)
+    rep_type = get_store().get(inpath)['content_type']
     if rep_type is None:
         print('Error: Input file %s is not a REP.' % inpath, file=sys.stderr)
         sys.stdout.flush()
@@ -400,38 +531,346 @@ def make_html(inpath, verbose=0):
         print(inpath, "(%s)" % rep_type, "->", outpath)
         sys.stdout.flush()
     outfile = open(outpath, "wb")
-    REP_TYPE_DISPATCH[rep_type](inpath, input_lines, outfile)
+    if timing.recorder is not None:
+        timing.recorder.rep = inpath
+    with timing.stage('render (%s)' % rep_type):
+        REP_TYPE_DISPATCH[rep_type](inpath, input_lines, outfile)
     outfile.close()
     os.chmod(outfile.name, 0o664)
     return outpath
 
 
-def push_rep(htmlfiles, rstfiles, username, verbose, local=0):
-    quiet = ""
-    if local:
+def render_rep(path):
+    """Return the HTML of the REP at `path`, as bytes, without writing it.
+
+    Docutils is set up by the first call only, so other tools can call
+    this in a loop.  Raise ValueError if `path` is not a REP this build can
+    render.
+    """
+    with open(path) as f:
+        input_lines = f.read().splitlines(True)
+    rep_type = get_store().get(path)['content_type']
+    if rep_type is None:
+        raise ValueError('%s is not a REP' % path)
+    if REP_TYPE_DISPATCH.get(rep_type) is None:
+        raise ValueError('Cannot render REP %s of type %s'
+                         % (path, rep_type))
+    outfile = io.BytesIO()
+    # Like make_html(), which writes the page next to its source.
+    outfile.name = os.path.splitext(path)[0] + '.html'
+    REP_TYPE_DISPATCH[rep_type](path, input_lines, outfile)
+    return outfile.getvalue()
+
+
+_inputs_digests = {}
+_read_digest = None
+
+
+def _digest_or_missing(path):
+    try:
+        return file_digest(path)
+    except (IOError, OSError):
+        return 'missing'
+
+
+def build_key(inpath, rep_type):
+    """Return a key that changes whenever the HTML for `inpath` would."""
+    if rep_type not in _inputs_digests:
+        try:
+            import docutils
+            version = docutils.__version__
+        except ImportError:
+            version = ''
+        # Whether mermaid diagrams are rendered at build time depends on
+        # the renderer installed.
+        if rep_type == 'text/x-rst':
+            version += ' ' + repbuild.mermaid.renderer_id()
+            # So is whether images get downscaled variants.
+            version += ' pillow' * (repbuild.assets.Image is not None)
+        _inputs_digests[rep_type] = digest(
+            version, rep_type,
+            *[_digest_or_missing(path) for path in BUILD_INPUTS[rep_type]])
+    parts = [_inputs_digests[rep_type], file_digest(inpath)]
+    if rep_type == 'text/x-rst':
+        # The HTML links to the images the REP shows by the hash of their
+        # content, and gives their size.
+        with open(inpath, 'rb') as f:
+            source = f.read().decode('utf-8', 'replace')
+        for uri in sorted(set(IMAGE_DIRECTIVE.findall(source))):
+            path = os.path.join(os.path.dirname(inpath), uri)
+            if ':' not in uri and os.path.isfile(path):
+                parts.extend([uri, file_digest(path)])
+    return digest(*parts)
+
+
+def doctree_key(inpath, source):
+    """Return a key that changes whenever the doctree of the reST REP
+    `inpath`, whose text is `source`, would."""
+    global _read_digest
+    if _read_digest is None:
+        import docutils
+        _read_digest = digest(
+            docutils.__version__, sys.version,
+            *[_digest_or_missing(path) for path in READ_INPUTS])
+    return digest(_read_digest, inpath, source)
+
+
+def _make_html_captured(args):
+    """Run `make_html` in a worker, returning its output instead of
+    printing it so the parent can report it in input order."""
+    inpath, verbose = args
+    real_stdout, real_stderr = sys.stdout, sys.stderr
+    sys.stdout = StringIO()
+    sys.stderr = StringIO()
+    try:
+        outpath = make_html(inpath, verbose=verbose)
+        return outpath, sys.stdout.getvalue(), sys.stderr.getvalue()
+    finally:
+        sys.stdout, sys.stderr = real_stdout, real_stderr
+
+
+def build_reps(files, verbose=0, jobs=1, manifest=None, force=0):
+    """Run `make_html` over `files` and return the list of HTML files
+    written.  With `jobs` > 1 the files are rendered in a process pool.
+
+    If a `manifest` is given, REPs whose build key matches the manifest and
+    whose HTML exists are not rebuilt (but are still returned) unless
+    `force` is true, and the manifest is updated with the keys of the REPs
+    that were built.
+    """
+    html = []
+    keys = {}
+    if manifest is not None:
+        stale = []
+        store = get_store()
+        for file in files:
+            rep_type = None
+            if os.path.exists(file):
+                rep_type = store.get(file)['content_type']
+            if rep_type not in BUILD_INPUTS:
+                # Let make_html() report the problem.
+                stale.append(file)
+                continue
+            keys[file] = build_key(file, rep_type)
+            outpath = os.path.splitext(file)[0] + ".html"
+            if (not force and manifest.get(file) == keys[file] and
+                    os.path.exists(outpath)):
+                html.append(outpath)
+            else:
+                stale.append(file)
+        files = stale
+        # Workers only read the store; save what was just parsed so that
+        # they do not have to parse it again.
+        store.save()
+    # Written once here rather than racing in the workers.
+    repbuild.styles.get_bundle()
+    if REP_TYPE_DISPATCH['text/x-rst'] and jobs > 1 and len(files) > 1:
+        # Built once here, the workers inherit the settings.
+        get_docutils_settings()
+    built = _build_reps(files, verbose, jobs)
+    for file, newfile in zip(files, built):
+        if newfile:
+            html.append(newfile)
+            if file in keys:
+                manifest[file] = keys[file]
+        elif manifest is not None:
+            del manifest[file]
+    if manifest is not None:
+        manifest.save()
+    get_store().save()
+    return html
+
+
+def _build_reps(files, verbose, jobs):
+    """Return the `make_html` result for each of `files`, in order."""
+    if jobs <= 1 or len(files) <= 1:
+        return [make_html(file, verbose=verbose) for file in files]
+    results = []
+    pool = multiprocessing.Pool(min(jobs, len(files)),
+                                initializer=check_requirements)
+    try:
+        # imap() hands back results in input order, so messages come out
+        # exactly as they would in a serial build.
+        for newfile, out, err in pool.imap(
+                _make_html_captured, [(file, verbose) for file in files]):
+            sys.stdout.write(out)
+            sys.stdout.flush()
+            sys.stderr.write(err)
+            sys.stderr.flush()
+            results.append(newfile)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def serve(infile=None, outfile=None, verbose=1):
+    """Answer JSON-lines render requests from `infile` until end of file."""
+    import json
+    import traceback
+    if infile is None:
+        infile = sys.stdin
+    if outfile is None:
+        outfile = sys.stdout
+    if REP_TYPE_DISPATCH['text/x-rst']:
+        get_docutils_settings()
+    for line in iter(infile.readline, ''):
+        if not line.strip():
+            continue
+        response = {}
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            inpath = find_rep(str(request['rep']))
+            response['rep'] = inpath
+            (response['html'], response['messages'],
+             response['errors']) = _make_html_captured((inpath, verbose))
+        except Exception:
+            response.update(html=None, messages='',
+                            errors=traceback.format_exc())
+        outfile.write(json.dumps(response) + '\n')
+        outfile.flush()
+
+
+def watch_snapshot():
+    """Return {path: mtime} for every file --watch looks at."""
+    paths = glob.glob("rep-*.rst") + ['rep-html-template']
+    for top in glob.glob("rep-[0-9][0-9][0-9][0-9]") + ['css']:
+        for dirpath, dirnames, filenames in os.walk(top):
+            paths.extend(os.path.join(dirpath, name) for name in filenames)
+    snapshot = {}
+    for path in paths:
+        try:
+            snapshot[path] = os.stat(path).st_mtime
+        except OSError:
+            pass
+    return snapshot
+
+
+def get_header(inpath):
+    """Return the RFC 2822 header block of a REP, or None."""
+    input_lines = get_input_lines(inpath)
+    if input_lines is None:
+        return None
+    header = []
+    for line in input_lines:
+        if not line.strip():
+            break
+        header.append(line)
+    return EMPTYSTRING.join(header)
+
+
+def _inotify_waiter():
+    """Return a function blocking until something under the watched
+    directories changes, or None if inotify is not available."""
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        return None
+    inotify = INotify()
+    mask = (flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE |
+            flags.MOVED_FROM | flags.MOVED_TO)
+    watched = set()
+
+    def wait():
+        dirs = set(['.'])
+        for top in ['css'] + glob.glob("rep-[0-9][0-9][0-9][0-9]"):
+            dirs.update(dirpath for dirpath, _, _ in os.walk(top))
+        for dirpath in dirs - watched:
+            inotify.add_watch(dirpath, mask)
+            watched.add(dirpath)
+        inotify.read(read_delay=int(WATCH_DEBOUNCE * 1000))
+    return wait
+
+
+def watch(verbose=1, jobs=1, manifest=None):
+    """Re-render REPs whenever their inputs change, until interrupted."""
+    import traceback
+    wait = _inotify_waiter()
+    if wait is None:
         if verbose:
-            quiet = "-v"
+            print('inotify_simple not available; polling for changes')
+        wait = lambda: time.sleep(WATCH_INTERVAL)
+    previous = watch_snapshot()
+    headers = dict((path, get_header(path)) for path in previous
+                   if path.endswith('.rst') and path != 'rep-0000.rst')
+    if verbose:
+        print('Watching %d files for changes' % len(previous))
+        sys.stdout.flush()
+    while True:
+        wait()
+        current = watch_snapshot()
+        if current == previous:
+            continue
+        # Let a burst of saves finish before rebuilding anything.
+        while True:
+            time.sleep(WATCH_DEBOUNCE)
+            settled = watch_snapshot()
+            if settled == current:
+                break
+            current = settled
+        changed = [path for path in set(previous) | set(current)
+                   if previous.get(path) != current.get(path)]
+        previous = current
+
+        reps = set()
+        forced = set()
+        index = False
+        for path in changed:
+            top = path.split(os.sep)[0]
+            if path == 'rep-html-template' or top == 'css':
+                reps.update(p for p in current if p.endswith('.rst'))
+            elif path.endswith('.rst'):
+                reps.add(path)
+                if path != 'rep-0000.rst':
+                    header = path in current and get_header(path) or None
+                    index = index or header != headers.get(path)
+                    headers[path] = header
+            elif top.startswith('rep-') and top + '.rst' in current:
+                # A file of the REP's own directory: the build key only
+                # covers the images it shows, so force the render for the
+                # files it uses in other ways (includes, say).
+                reps.add(top + '.rst')
+                forced.add(top + '.rst')
+        try:
+            if index:
+                import genrepindex
+                if verbose:
+                    print('REP headers changed; regenerating rep-0000.rst')
+                genrepindex.main(['genrepindex.py', '.'])
+                reps.add('rep-0000.rst')
+                forced.add('rep-0000.rst')
+            if manifest is not None:
+                for path in forced:
+                    del manifest[path]
+            build_reps(sorted(path for path in reps if os.path.exists(path)),
+                       verbose=verbose, jobs=jobs, manifest=manifest)
+        except (Exception, SystemExit):
+            traceback.print_exc()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+def push_rep(htmlfiles, rstfiles, username, verbose, local=0, jobs=1):
+    """Install the given files, sending only those whose content changed
+    since they were last installed (see repbuild.deploy)."""
+    if local:
         target = HDIR
-        copy_cmd = "cp"
-        #chmod_cmd = "chmod"
     else:
-        if not verbose:
-            quiet = "-q"
         if username:
             username = username + "@"
         target = username + HOST + ":" + HDIR
-        copy_cmd = "scp"
-        #chmod_cmd = "ssh %s%s chmod" % (username, HOST)
     files = htmlfiles[:]
     files.extend(rstfiles)
-    files.append("css/rep.css")
-    filelist = SPACE.join(files)
-    rc = os.system("%s %s %s %s" % (copy_cmd, quiet, filelist, target))
-    if rc:
-        sys.exit(rc)
-##    rc = os.system("%s 664 %s/*" % (chmod_cmd, HDIR))
-##    if rc:
-##        sys.exit(rc)
+    # What the pages link to: the stylesheet bundle and the published
+    # images (unchanged ones are not sent again).
+    files.append(repbuild.styles.get_bundle()[0])
+    files.extend(path for path in site_files()
+                 if path.startswith(repbuild.assets.ASSET_DIR + os.sep))
+    try:
+        deploy(target, files, jobs=max(jobs, 1), verbose=verbose)
+    except subprocess.CalledProcessError as error:
+        sys.exit(error.returncode)
 
 REP_TYPE_DISPATCH = {'text/plain': fixfile,
                      'text/x-rst': fix_rst_rep}
@@ -493,12 +932,18 @@ def browse_remote(rep):
 
 
 def main(argv=None):
+    global use_doctree_cache
     # defaults
     update = 0
     local = 0
     username = ''
     verbose = 1
     browse = 0
+    jobs = 1
+    force = 0
+    watching = 0
+    serving = 0
+    trace = None
 
     check_requirements()
 
@@ -507,8 +952,10 @@ def main(argv=None):
 
     try:
         opts, args = getopt.getopt(
-            argv, 'bilhqu:',
-            ['browse', 'install', 'local', 'help', 'quiet', 'user='])
+            argv, 'bilhqu:j:fw',
+            ['browse', 'install', 'local', 'help', 'quiet', 'user=',
+             'jobs=', 'force', 'profile', 'profile-trace=', 'watch',
+             'serve'])
     except getopt.error as msg:
         usage(1, msg)
 
@@ -526,34 +973,65 @@ def main(argv=None):
             verbose = 0
         elif opt in ('-b', '--browse'):
             browse = 1
+        elif opt in ('-j', '--jobs'):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                usage(1, 'Error: --jobs expects an integer, not %r' % arg)
+        elif opt in ('-f', '--force'):
+            force = 1
+        elif opt in ('--profile', '--profile-trace'):
+            timing.recorder = timing.Recorder()
+            trace = arg or None
+        elif opt in ('-w', '--watch'):
+            watching = 1
+        elif opt == '--serve':
+            serving = 1
+
+    if timing.recorder is not None:
+        # Profile everything asked for, in this process.
+        force = 1
+        jobs = 1
+    if force:
+        use_doctree_cache = False
+
+    if serving:
+        serve(verbose=verbose)
+        return
+
+    manifest = Manifest(BUILD_MANIFEST)
+    if watching:
+        try:
+            watch(verbose=verbose, jobs=jobs, manifest=manifest)
+        except KeyboardInterrupt:
+            pass
+        return
 
     if args:
-        reprst = []
-        html = []
-        for rep in args:
-            file = find_rep(rep)
-            reprst.append(file)
-            newfile = make_html(file, verbose=verbose)
-            if newfile:
-                html.append(newfile)
-                if browse and not update:
+        reprst = [find_rep(rep) for rep in args]
+        html = build_reps(reprst, verbose=verbose, jobs=jobs,
+                          manifest=manifest, force=force)
+        if browse and not update:
+            for rep, file in zip(args, reprst):
+                if os.path.splitext(file)[0] + ".html" in html:
                     browse_file(rep)
     else:
         # do them all
-        reprst = []
-        html = []
-        files = glob.glob("rep-*.rst")
-        files.sort()
-        for file in files:
-            reprst.append(file)
-            newfile = make_html(file, verbose=verbose)
-            if newfile:
-                html.append(newfile)
+        reprst = glob.glob("rep-*.rst")
+        reprst.sort()
+        html = build_reps(reprst, verbose=verbose, jobs=jobs,
+                          manifest=manifest, force=force)
         if browse and not update:
             browse_file("0")
 
+    if timing.recorder is not None:
+        if trace:
+            timing.recorder.write_trace(trace)
+        else:
+            timing.recorder.write_table()
+
     if update:
-        push_rep(html, reprst, username, verbose, local=local)
+        push_rep(html, reprst, username, verbose, local=local, jobs=jobs)
         if browse:
             if args:
                 for rep in args:
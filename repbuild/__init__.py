@@ -0,0 +1 @@
+"""Support code for building and publishing the REP web site."""
@@ -0,0 +1,131 @@
+"""Publish the images of the REPs under content-hashed names.
+
+Every local image a REP shows is copied to assets/, named after a
+hash of its content (``assets/rep-0119/mini_max.1a2b3c4d5e.png``), so the
+web server can let browsers cache it for good.  When Pillow is installed,
+downscaled variants of raster images are written too, for ``srcset``.
+
+A hashed name changes exactly when the image does, so an asset that
+already exists is up to date, and unchanged images are never processed
+again.
+"""
+
+from __future__ import absolute_import
+
+import io
+import os
+import struct
+
+from .manifest import atomic_write, file_digest
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ASSET_DIR = 'assets'
+HASH_LENGTH = 10
+# Widths of the downscaled variants, for screens of common sizes.
+VARIANT_WIDTHS = (480, 960, 1440)
+RASTER_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG',
+                  '.gif': 'GIF'}
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            continue
+        length, = struct.unpack('>H', f.read(2))
+        # Start of frame markers, except DHT, JPG and DAC.
+        if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8,
+                                                            0xCC):
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, io.SEEK_CUR)
+
+
+def image_size(path):
+    """Return the (width, height) of the PNG, GIF or JPEG image at `path`,
+    read from its header, or None."""
+    with open(path, 'rb') as f:
+        head = f.read(26)
+        try:
+            if (head.startswith(b'\x89PNG\r\n\x1a\n') and
+                    head[12:16] == b'IHDR'):
+                return struct.unpack('>II', head[16:24])
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            if head.startswith(b'\xff\xd8'):
+                return _jpeg_size(f)
+        except struct.error:
+            pass
+    return None
+
+
+def _publish(name, write):
+    """Write the asset `name` with `write(file)` unless it exists."""
+    if os.path.exists(name):
+        return
+    dirname = os.path.dirname(name)
+    os.makedirs(dirname, exist_ok=True)
+    buf = io.BytesIO()
+    write(buf)
+    atomic_write(name, buf.getvalue())
+
+
+def _copy(path):
+    def write(out):
+        with open(path, 'rb') as f:
+            out.write(f.read())
+    return write
+
+
+def _downscale(path, width, height, image_format):
+    def write(out):
+        with Image.open(path) as image:
+            image.resize((width, height), Image.LANCZOS).save(
+                out, image_format, optimize=True)
+    return write
+
+
+def publish_image(path):
+    """Publish the image at `path`, a path relative to the top of the site.
+
+    Return None if `path` is not a local image, or else a dict with the
+    ``url`` of its published copy, its ``width`` and ``height`` in pixels
+    (None if unknown) and its ``srcset``, a list of ``(url, width)``
+    pairs, empty unless there are downscaled variants.
+    """
+    path = os.path.normpath(path)
+    if (os.path.isabs(path) or path.startswith(os.pardir) or
+            not os.path.isfile(path)):
+        return None
+    root, ext = os.path.splitext(path)
+    stem = '%s.%s' % (root, file_digest(path)[:HASH_LENGTH])
+    url = os.path.join(ASSET_DIR, stem + ext)
+    _publish(url, _copy(path))
+    size = None
+    if ext.lower() in RASTER_FORMATS:
+        size = image_size(path)
+    srcset = []
+    if size is not None and Image is not None:
+        width, height = size
+        for variant_width in VARIANT_WIDTHS:
+            if variant_width >= width:
+                break
+            variant_height = max(1, int(round(
+                height * variant_width / float(width))))
+            variant = os.path.join(
+                ASSET_DIR, '%s-%dw%s' % (stem, variant_width, ext))
+            _publish(variant, _downscale(path, variant_width, variant_height,
+                                         RASTER_FORMATS[ext.lower()]))
+            srcset.append((variant.replace(os.sep, '/'), variant_width))
+        if srcset:
+            srcset.append((url.replace(os.sep, '/'), width))
+    return {'url': url.replace(os.sep, '/'),
+            'width': size and size[0], 'height': size and size[1],
+            'srcset': srcset}
@@ -0,0 +1,146 @@
+"""Write precompressed sidecars for the built REP site.
+
+Usage: python -m repbuild.compress [options]
+
+For every compressible file the build writes -- the pages, stylesheets,
+scripts, published images, REP 0 and the search index, but not the REP
+sources or their rep-NNNN/ directories -- write FILE.gz, and FILE.br
+too when the brotli module is installed, so the web server can send them
+as they are instead of compressing on each request.  Files whose content
+is unchanged since their sidecars were written (recorded in
+%(COMPRESS_MANIFEST)s) are skipped.
+
+Options:
+
+-j N, --jobs=N
+    Number of files to compress in parallel (default: %(DEFAULT_JOBS)s).
+
+-f, --force
+    Recompress every file.
+
+-q, --quiet
+    Do not list the files as they are compressed.
+
+-h, --help
+    Print this help message and exit.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import getopt
+import gzip
+import io
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .deploy import site_files
+from .manifest import Manifest, atomic_write, file_digest
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MANIFEST = '.rep-compress-manifest.json'
+DEFAULT_JOBS = os.cpu_count() or 1
+
+COMPRESSIBLE = ('.html', '.css', '.js', '.json', '.ndjson', '.rst', '.svg')
+# Only what the build writes: the REP sources and their rep-NNNN/ image
+# directories are left alone.
+BUILD_OUTPUTS = ['*.html', 'mermaid.js', 'search.js', 'rep-0000.rst',
+                 'rep-0000.json', 'rep-0000.ndjson', 'css/*', 'assets/*/*',
+                 'search/*']
+
+
+def sidecars(path):
+    """Return the sidecar files written for `path`."""
+    names = [path + '.gz']
+    if brotli is not None:
+        names.append(path + '.br')
+    return names
+
+
+def compress_file(path):
+    """Write the sidecars of `path`; return `path`."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    buf = io.BytesIO()
+    # A fixed mtime keeps the .gz output identical for identical input.
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf, mtime=0,
+                       compresslevel=9) as gz:
+        gz.write(data)
+    atomic_write(path + '.gz', buf.getvalue())
+    if brotli is not None:
+        atomic_write(path + '.br', brotli.compress(data))
+    return path
+
+
+def compress_site(files=None, jobs=DEFAULT_JOBS, manifest=None, verbose=1):
+    """Compress those of `files` (default: the compressible build outputs)
+    that changed since they were last compressed.  Return the list
+    of files compressed."""
+    if files is None:
+        files = [path for path in site_files(BUILD_OUTPUTS)
+                 if path.endswith(COMPRESSIBLE)]
+    if manifest is None:
+        manifest = Manifest(COMPRESS_MANIFEST)
+    digests = dict((path, file_digest(path)) for path in files)
+    stale = [path for path in files
+             if manifest.get(path) != digests[path] or
+             not all(os.path.exists(name) for name in sidecars(path))]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            # zlib and brotli release the GIL, so threads compress in
+            # parallel.
+            for path in executor.map(compress_file, stale):
+                if verbose:
+                    print(path, '->', ', '.join(sidecars(path)))
+                manifest[path] = digests[path]
+    finally:
+        manifest.save()
+    return stale
+
+
+def usage(code, msg=''):
+    """Print usage message and exit.  Uses stderr if code != 0."""
+    if code == 0:
+        out = sys.stdout
+    else:
+        out = sys.stderr
+    print(__doc__ % globals(), file=out)
+    if msg:
+        print(msg, file=out)
+    sys.exit(code)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(argv, 'j:fqh',
+                                   ['jobs=', 'force', 'quiet', 'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+    jobs = DEFAULT_JOBS
+    verbose = 1
+    manifest = Manifest(COMPRESS_MANIFEST)
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-j', '--jobs'):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                usage(1, 'Error: --jobs expects an integer, not %r' % arg)
+        elif opt in ('-f', '--force'):
+            manifest.clear()
+        elif opt in ('-q', '--quiet'):
+            verbose = 0
+    compress_site(jobs=jobs, manifest=manifest, verbose=verbose)
+
+
+if __name__ == '__main__':
+    main()
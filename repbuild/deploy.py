@@ -0,0 +1,198 @@
+"""Publish the built REP site, transferring only files that changed.
+
+Usage: python -m repbuild.deploy [options] TARGET
+
+TARGET is either a local directory or an rsync-style ``[user@]host:dir``.
+The content hash of every file published to a target is remembered in
+%(DEPLOY_MANIFEST)s, so the next deploy to the same target only sends
+the files whose content changed since.  Files are copied in parallel; remote
+files are sent in batches by parallel rsync processes.
+
+Options:
+
+-j N, --jobs=N
+    Number of parallel transfers (default: %(DEFAULT_JOBS)s).
+
+-a, --all
+    Send every file, ignoring what was published before.  Use this if the
+    target may have been changed by someone else.
+
+-n, --dry-run
+    Only list the files that would be sent.
+
+-q, --quiet
+    Do not list the files as they are sent.
+
+-h, --help
+    Print this help message and exit.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import getopt
+import glob
+import os
+import shutil
+import subprocess
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .manifest import Manifest, file_digest
+
+DEPLOY_MANIFEST = '.rep-deploy-manifest.json'
+DEFAULT_JOBS = 4
+
+# What makes up the published site, relative to the top of the tree.
+SITE_PATTERNS = ['README.txt', '*.html', 'mermaid.js', 'search.js',
+                 'search/*', 'css/*',
+                 'rep-0000.rst', 'rep-0000.json', 'rep-0000.ndjson',
+                 # The pages link to the published copies of the images
+                 # in rep-NNNN/ (see repbuild.assets), not to those.
+                 'assets/*/*',
+                 # Precompressed sidecars (see repbuild.compress).
+                 '*.gz', '*.br', 'search/*.gz', 'search/*.br']
+
+
+def site_files(patterns=SITE_PATTERNS):
+    """Return the sorted list of files that make up the site."""
+    files = set()
+    for pattern in patterns:
+        files.update(path for path in glob.glob(pattern)
+                     if os.path.isfile(path))
+    return sorted(files)
+
+
+def is_remote(target):
+    """Return whether `target` names a remote (``host:dir``) location."""
+    head = target.split('/', 1)[0]
+    return ':' in head
+
+
+def _copy_local(files, target):
+    for path in files:
+        destination = os.path.join(target, path)
+        dirname = os.path.dirname(destination)
+        os.makedirs(dirname, exist_ok=True)
+        shutil.copy2(path, destination)
+    return files
+
+
+def _copy_remote(files, target):
+    # --relative keeps the directory part of each path on the far side.
+    command = ['rsync', '--relative', '--times', '--files-from=-', '.',
+               target]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    process.communicate(''.join(path + '\n' for path in files)
+                        .encode('utf-8'))
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return files
+
+
+def _batches(files, count):
+    """Split `files` into at most `count` batches of similar size."""
+    count = max(1, min(count, len(files)))
+    return [files[index::count] for index in range(count)]
+
+
+def deploy(target, files=None, jobs=DEFAULT_JOBS, manifest=None,
+           verbose=1, dry_run=False):
+    """Send those of `files` (default: the whole site) that changed since
+    they were last sent to `target`.  Return the list of files sent.
+
+    `manifest` is the `Manifest` recording what each target was last sent;
+    it is updated as batches complete, so an interrupted deploy resumes
+    where it stopped.
+    """
+    if files is None:
+        files = site_files()
+    if manifest is None:
+        manifest = Manifest(DEPLOY_MANIFEST)
+    published = dict(manifest.get(target) or {})
+    digests = dict((path, file_digest(path)) for path in files)
+    changed = [path for path in files if published.get(path) != digests[path]]
+    if verbose or dry_run:
+        for path in changed:
+            print(path, '->', target)
+        sys.stdout.flush()
+    if dry_run or not changed:
+        return changed
+
+    if is_remote(target):
+        copy = _copy_remote
+        batches = _batches(changed, jobs)
+    else:
+        copy = _copy_local
+        batches = _batches(changed, jobs * 4)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            for sent in executor.map(lambda batch: copy(batch, target),
+                                     batches):
+                for path in sent:
+                    published[path] = digests[path]
+    finally:
+        manifest[target] = published
+        manifest.save()
+    return changed
+
+
+def usage(code, msg=''):
+    """Print usage message and exit.  Uses stderr if code != 0."""
+    if code == 0:
+        out = sys.stdout
+    else:
+        out = sys.stderr
+    print(__doc__ % globals(), file=out)
+    if msg:
+        print(msg, file=out)
+    sys.exit(code)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(argv, 'j:anqh',
+                                   ['jobs=', 'all', 'dry-run', 'quiet',
+                                    'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+    jobs = DEFAULT_JOBS
+    verbose = 1
+    dry_run = False
+    everything = False
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-j', '--jobs'):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                usage(1, 'Error: --jobs expects an integer, not %r' % arg)
+        elif opt in ('-a', '--all'):
+            everything = True
+        elif opt in ('-n', '--dry-run'):
+            dry_run = True
+        elif opt in ('-q', '--quiet'):
+            verbose = 0
+    if len(args) != 1:
+        usage(1, 'Error: expected exactly one TARGET')
+    target = args[0]
+
+    manifest = Manifest(DEPLOY_MANIFEST)
+    if everything:
+        del manifest[target]
+    try:
+        sent = deploy(target, jobs=jobs, manifest=manifest, verbose=verbose,
+                      dry_run=dry_run)
+    except subprocess.CalledProcessError as error:
+        sys.exit(error.returncode)
+    if verbose:
+        print('%d file(s) %s to %s' % (len(sent), 'would be sent'
+                                       if dry_run else 'sent', target))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Cache the transformed doctrees of the reST REPs.
+
+Reading a reST REP (parsing it and applying the transforms, among them
+the Headers, Contents and TargetNotes transforms of the REP reader) costs
+far more than writing its HTML.  The doctree is pickled to
+.rep-doctree-cache/ with a key made from its source and from the code
+and configuration that read it, the writer's transforms included, so a
+build after a change to the template or the stylesheets only runs the
+writer again.
+"""
+
+from __future__ import absolute_import
+
+import os
+import pickle
+
+from docutils import utils
+from docutils.transforms import Transformer
+
+from .manifest import atomic_write
+
+DOCTREE_CACHE = '.rep-doctree-cache'
+
+
+def cache_path(path):
+    """Return the cache file for the doctree of the REP at `path`."""
+    return os.path.join(DOCTREE_CACHE, os.path.basename(path) + '.pickle')
+
+
+def load(path, key, settings):
+    """Return the cached doctree of the REP at `path`, set up to be
+    written with `settings`, or None unless it was cached with `key`."""
+    try:
+        with open(cache_path(path), 'rb') as f:
+            cached_key, document = pickle.load(f)
+    except Exception:
+        # Missing, or written by code that is gone.
+        return None
+    if cached_key != key:
+        return None
+    document.settings = settings
+    document.reporter = utils.new_reporter(document['source'], settings)
+    document.transformer = Transformer(document)
+    return document
+
+
+def save(path, key, document):
+    """Cache `document`, the doctree of the REP at `path`, under `key`."""
+    # The settings, reporter and transformer hold streams and the
+    # components of the publisher; load() gives the doctree new ones.
+    saved = document.settings, document.reporter, document.transformer
+    document.settings = document.reporter = document.transformer = None
+    try:
+        data = pickle.dumps((key, document), pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, RecursionError, TypeError):
+        # Not worth failing the build for.
+        return
+    finally:
+        document.settings, document.reporter, document.transformer = saved
+    os.makedirs(DOCTREE_CACHE, exist_ok=True)
+    atomic_write(cache_path(path), data)
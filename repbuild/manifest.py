@@ -0,0 +1,90 @@
+"""Content-hash manifests, used to skip work whose inputs have not changed."""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+def file_digest(path):
+    """Return the SHA-1 hex digest of the file at `path`."""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def digest(*parts):
+    """Return the SHA-1 hex digest of a sequence of strings."""
+    sha = hashlib.sha1()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = part.encode('utf-8')
+        sha.update(part)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def atomic_write(path, data, mode=0o644):
+    """Write `data` (bytes) to `path` through a temporary file and a rename,
+    so that readers never see a partially written file."""
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmppath = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmppath, mode)
+        os.replace(tmppath, path)
+    except BaseException:
+        os.unlink(tmppath)
+        raise
+
+
+class Manifest(object):
+
+    """A persistent mapping of names to content keys, stored as JSON.
+
+    A missing or unreadable manifest file is treated as empty, which simply
+    means everything is considered out of date.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+        self.dirty = False
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def __setitem__(self, name, key):
+        if self.entries.get(name) != key:
+            self.entries[name] = key
+            self.dirty = True
+
+    def __delitem__(self, name):
+        if name in self.entries:
+            del self.entries[name]
+            self.dirty = True
+
+    def clear(self):
+        if self.entries:
+            self.entries = {}
+            self.dirty = True
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = json.dumps(self.entries, indent=1, sort_keys=True)
+        atomic_write(self.path, data.encode('utf-8'))
+        self.dirty = False
@@ -0,0 +1,115 @@
+"""Render mermaid diagrams to SVG at build time.
+
+The ``<div class="mermaid">`` blocks of a REP, whatever their other
+classes and attributes, are rendered once by a local mermaid renderer,
+the mermaid-cli ``mmdc`` command by default (set $REP_MERMAID_RENDERER to
+use another command taking the same ``-i``, ``-o`` and ``-I`` options, or
+to an empty string to render nothing).  The SVG of each diagram is
+cached in .rep-mermaid-cache/ under a hash of its source, so a diagram is
+never rendered twice.
+
+Pages whose diagrams were all rendered are served as they are; any
+diagram that could not be rendered is left to mermaid.js in the browser.
+"""
+
+from __future__ import absolute_import
+
+import html
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import tempfile
+import textwrap
+
+from .manifest import atomic_write, digest
+
+MERMAID_CACHE = '.rep-mermaid-cache'
+RENDERER_VARIABLE = 'REP_MERMAID_RENDERER'
+
+# Group 1 holds the attributes of the <div>, group 3 the diagram source.
+DIAGRAM = re.compile(r'''<div\b([^>]*\bclass\s*=\s*(["'])[^"']*\bmermaid\b'''
+                     r'''[^"']*\2[^>]*)>(.*?)</div>''', re.S)
+CLASS = re.compile(r'''(\bclass\s*=\s*(["']))([^"']*)(\2)''')
+XML_PROLOG = re.compile(r'^\s*<\?xml[^>]*\?>\s*')
+
+
+def renderer():
+    """Return the renderer command as a list, or None if there is none."""
+    command = shlex.split(os.environ.get(RENDERER_VARIABLE, 'mmdc'))
+    if not command or shutil.which(command[0]) is None:
+        return None
+    return command
+
+
+def renderer_id():
+    """Return a string that changes whenever the renderer does."""
+    command = renderer()
+    if command is None:
+        return ''
+    return ' '.join([shutil.which(command[0])] + command[1:])
+
+
+def render(source, command=None):
+    """Return the SVG for the mermaid diagram `source`, or None if it could
+    not be rendered."""
+    if command is None:
+        command = renderer()
+        if command is None:
+            return None
+    key = digest(' '.join(command), source)
+    path = os.path.join(MERMAID_CACHE, key + '.svg')
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8')
+    except (IOError, OSError):
+        pass
+    scratch = tempfile.mkdtemp()
+    try:
+        infile = os.path.join(scratch, 'diagram.mmd')
+        outfile = os.path.join(scratch, 'diagram.svg')
+        with open(infile, 'wb') as f:
+            f.write(source.encode('utf-8'))
+        try:
+            # A page may hold several diagrams, so each needs its own ids.
+            subprocess.check_call(
+                command + ['-i', infile, '-o', outfile,
+                           '-I', 'mermaid-' + key[:12]],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with open(outfile, 'rb') as f:
+                svg = XML_PROLOG.sub('', f.read().decode('utf-8'))
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(MERMAID_CACHE, exist_ok=True)
+    atomic_write(path, svg.encode('utf-8'))
+    return svg
+
+
+def prerender(text):
+    """Replace the mermaid diagrams of the HTML `text` with their SVG.
+
+    Return the new text and the number of diagrams left for mermaid.js.
+    """
+    command = renderer()
+    if command is None:
+        return text, len(DIAGRAM.findall(text))
+    pending = [0]
+
+    def replace(match):
+        # mermaid.js renders the text content of the element.
+        source = textwrap.dedent(html.unescape(match.group(3))).strip()
+        svg = render(source, command)
+        if svg is None:
+            pending[0] += 1
+            return match.group(0)
+        # The wrapper keeps the attributes of the diagram, but must not
+        # look like one to mermaid.js.
+        attributes = CLASS.sub(
+            lambda attr: attr.group(1) + re.sub(
+                r'\bmermaid\b', 'diagram', attr.group(3)) + attr.group(4),
+            match.group(1), 1)
+        return '<div%s>%s</div>' % (attributes, svg)
+    return DIAGRAM.sub(replace, text), pending[0]
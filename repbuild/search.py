@@ -0,0 +1,190 @@
+"""Build the offline full-text search index of the REP site.
+
+Usage: python -m repbuild.search [options]
+
+The text of every REP is split into words, section by section, and an
+inverted index from each word to the REP sections it occurs in is written
+to the %(SEARCH_DIR)s/ directory.  The index is sharded by the first
+%(SHARD_PREFIX)s letters of the words, so search.js, which serves
+search.html, only fetches the shards of the words searched for.
+
+The words of each section come from the body records of `rep0.body`,
+which the link graph shares, so only the REPs changed since either was
+last built are read again.  Shards whose content is unchanged are not
+rewritten.
+
+Options:
+
+-q, --quiet
+    Do not list the files as they are written.
+
+-h, --help
+    Print this help message and exit.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import getopt
+import json
+import os
+import re
+import sys
+
+from rep0.body import get_body_store
+from rep0.metadata import get_store
+
+from .manifest import atomic_write
+from .template import get_template
+
+SEARCH_DIR = 'search'
+SEARCH_PAGE = 'search.html'
+SHARD_PREFIX = 2
+
+PAGE_TEMPLATE = 'rep-html-template'
+# What the page template has that the search page, not being a REP, has not.
+TEMPLATE_REP_ONLY = [
+    'REP %(rep)s -- ',
+    '[<b><a href="%(rephome)s/rep-%(repnum)s.rst">REP Source</a></b>]\n']
+
+PAGE_BODY = u"""\
+<h1>Search the REPs</h1>
+<form id="rep-search" action="search.html">
+<input type="search" name="q" size="40" autofocus>
+<input type="submit" value="Search">
+</form>
+<p id="rep-search-status"></p>
+<ol id="rep-search-results"></ol>
+<script src="search.js" defer></script>
+"""
+
+
+def render_page():
+    """Return the HTML of the search page, in the page template and with
+    the stylesheets of the REPs."""
+    # Imported here: rep2html sets up docutils, which indexing does not
+    # need.
+    import rep2html
+    template = get_template(PAGE_TEMPLATE)
+    for text in TEMPLATE_REP_ONLY:
+        template = template.replace(text, '')
+    return template.render({
+        'repindex': 'rep-0000.html',
+        'rep': '',
+        'repnum': '',
+        'rephome': '/reps',
+        'encoding': 'utf-8',
+        'version': '',
+        'title': 'Search the REPs',
+        'stylesheet': rep2html.page_stylesheet(),
+        'mermaid': '',
+        'body': PAGE_BODY,
+        })
+
+
+def rep_files(path='.'):
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))
+            if re.match(r'rep-\d+\.rst$', name) and name != 'rep-0000.rst']
+
+
+def build_index(files, store=None):
+    """Return (docs, shards) for the REP `files`.
+
+    `docs` lists ``[number, title, [[anchor, section title], ...]]`` for
+    each REP.  `shards` maps each word prefix to a dict from each word to
+    its postings, ``[doc, section, count]`` lists indexing into `docs`.
+    """
+    if store is None:
+        store = get_body_store()
+    metadata = get_store()
+    docs = []
+    shards = {}
+    for path in files:
+        number = metadata.get(path)['number']
+        if number is None:
+            continue
+        sections = store.get(path)['sections']
+        doc = len(docs)
+        docs.append([number, sections[0][1],
+                     [[anchor, title] for anchor, title, counts in sections]])
+        for section, (anchor, title, counts) in enumerate(sections):
+            for word in sorted(counts):
+                shard = shards.setdefault(word[:SHARD_PREFIX], {})
+                shard.setdefault(word, []).append(
+                    [doc, section, counts[word]])
+    return docs, shards
+
+
+def _write_if_changed(path, data):
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except (IOError, OSError):
+        pass
+    atomic_write(path, data)
+    return True
+
+
+def _dump(value):
+    return json.dumps(value, separators=(',', ':'),
+                      sort_keys=True).encode('utf-8')
+
+
+def write_index(path='.', verbose=1):
+    """Index the REPs in the directory `path`.  Return the list of files
+    written."""
+    store = get_body_store()
+    docs, shards = build_index(rep_files(path), store)
+    store.save()
+    get_store().save()
+    os.makedirs(SEARCH_DIR, exist_ok=True)
+    outputs = {SEARCH_PAGE: render_page().encode('utf-8'),
+               os.path.join(SEARCH_DIR, 'docs.json'): _dump(
+                   {'docs': docs, 'prefix': SHARD_PREFIX})}
+    for prefix, shard in shards.items():
+        outputs[os.path.join(SEARCH_DIR, prefix + '.json')] = _dump(shard)
+    # Remove the shards of words no longer in any REP, with their
+    # precompressed copies.
+    for name in os.listdir(SEARCH_DIR):
+        stale = os.path.join(SEARCH_DIR, name)
+        if os.path.splitext(stale)[0] not in outputs and stale not in outputs:
+            os.remove(stale)
+    written = [name for name in sorted(outputs)
+               if _write_if_changed(name, outputs[name])]
+    if verbose:
+        for name in written:
+            print(name)
+    return written
+
+
+def usage(code, msg=''):
+    """Print usage message and exit.  Uses stderr if code != 0."""
+    if code == 0:
+        out = sys.stdout
+    else:
+        out = sys.stderr
+    print(__doc__ % globals(), file=out)
+    if msg:
+        print(msg, file=out)
+    sys.exit(code)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(argv, 'qh', ['quiet', 'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+    verbose = 1
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-q', '--quiet'):
+            verbose = 0
+    write_index(verbose=verbose)
+
+
+if __name__ == '__main__':
+    main()
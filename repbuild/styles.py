@@ -0,0 +1,162 @@
+"""Bundle the stylesheets of the REP pages into one cached request.
+
+Usage: python -m repbuild.styles
+
+The stylesheets every page used to link one by one are concatenated, in
+the same cascade order and with the same media, minified, and written to
+css/rep-bundle.HASH.css, named after a hash of its content so the web
+server can let browsers cache it for good.  rep2html writes the bundle
+itself before rendering; this command only writes it.
+
+`head_links` returns the markup pages put in their <head> for it.  With
+``critical=True``, the rules needed to draw the top of a page are inlined
+and the bundle is loaded without blocking the first paint.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import glob
+import os
+import re
+
+from .manifest import atomic_write, digest
+
+# (stylesheet, media) in the order the pages linked them.
+BUNDLE_SOURCES = [('css/common.css', None), ('css/screen.css', 'screen'),
+                  ('css/print.css', 'print'), ('css/rep.css', None)]
+BUNDLE_PATTERN = 'css/rep-bundle.%s.css'
+HASH_LENGTH = 10
+
+# What the top of every REP page is made of: the rules whose selectors
+# only use these are inlined as critical CSS.
+CRITICAL_NAMES = frozenset([
+    'html', 'body', 'div', 'table', 'tbody', 'tr', 'td', 'th', 'col', 'a',
+    'img', 'form', 'label', 'input', 'nobr', 'h1', 'hr', 'p',
+    '#dpage', '#dpage-inner', '#header', '#topnav', '#topnav-table',
+    '#cse-search-box', '#input', '.header', '.rfc2822', '.docutils',
+    '.field-list', '.field-name', '.field-body'])
+
+COMMENT = re.compile(r'/\*.*?\*/', re.S)
+# Strings are kept as they are; whitespace around punctuation goes.
+MINIFY = re.compile(r'''("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')'''
+                    r'''|\s*([{};,>])\s*|(:)\s+|\s+''', re.S)
+SELECTOR_NAME = re.compile(r'[#.]?-?[_a-zA-Z][-_a-zA-Z0-9]*')
+
+
+def minify(css):
+    """Return `css` without comments and needless whitespace."""
+    def replace(match):
+        for group in match.groups():
+            if group is not None:
+                return group
+        return ' '
+    css = MINIFY.sub(replace, COMMENT.sub('', css)).strip()
+    return css.replace(';}', '}')
+
+
+def _rules(css):
+    """Split minified `css` into (prelude, body) pairs; the body of an
+    @media rule holds rules of its own."""
+    rules = []
+    pos = 0
+    while True:
+        brace = css.find('{', pos)
+        if brace < 0:
+            return rules
+        depth = 0
+        for end in range(brace, len(css)):
+            if css[end] == '{':
+                depth += 1
+            elif css[end] == '}':
+                depth -= 1
+                if depth == 0:
+                    break
+        rules.append((css[pos:brace].strip(), css[brace + 1:end]))
+        pos = end + 1
+
+
+def _critical_selector(selector):
+    # Pseudo-classes and attributes do not add elements to match.
+    names = SELECTOR_NAME.findall(re.sub(r'::?[-\w]+(\([^)]*\))?|\[[^]]*\]',
+                                         '', selector))
+    return bool(names) and all(name in CRITICAL_NAMES for name in names)
+
+
+def critical(css):
+    """Return the rules of the minified `css` that style the top of a REP
+    page, as minified CSS."""
+    kept = []
+    for prelude, body in _rules(css):
+        if prelude.startswith('@media'):
+            if 'print' in prelude:
+                continue
+            inner = critical(body)
+            if inner:
+                kept.append('%s{%s}' % (prelude, inner))
+        elif not prelude.startswith('@'):
+            selectors = [selector for selector in prelude.split(',')
+                         if _critical_selector(selector)]
+            if selectors:
+                kept.append('%s{%s}' % (','.join(selectors), body))
+    return ''.join(kept)
+
+
+def bundle_css():
+    """Return the minified CSS of the bundle."""
+    parts = []
+    for path, media in BUNDLE_SOURCES:
+        with open(path, 'rb') as f:
+            css = minify(f.read().decode('utf-8'))
+        if media:
+            css = '@media %s{%s}' % (media, css)
+        parts.append(css)
+    return '\n'.join(parts) + '\n'
+
+
+_bundle = None
+
+
+def get_bundle():
+    """Write the bundle unless it exists; return (url, critical CSS)."""
+    global _bundle
+    stamp = [(os.path.getmtime(path), os.path.getsize(path))
+             for path, media in BUNDLE_SOURCES]
+    if _bundle is None or _bundle[0] != stamp:
+        css = bundle_css()
+        url = BUNDLE_PATTERN % digest(css)[:HASH_LENGTH]
+        if not os.path.exists(url):
+            atomic_write(url, css.encode('utf-8'))
+            # Every page is rebuilt with the new bundle.
+            for stale in glob.glob(BUNDLE_PATTERN % '*'):
+                if stale == url:
+                    continue
+                for name in (stale, stale + '.gz', stale + '.br'):
+                    try:
+                        os.remove(name)
+                    except OSError:
+                        # Gone already, or never compressed.
+                        pass
+        _bundle = (stamp, url, critical(css))
+    return _bundle[1:]
+
+
+def head_links(critical=False):
+    """Return the <head> markup that loads the bundle."""
+    url, critical_css = get_bundle()
+    if not critical:
+        return '<link rel="stylesheet" type="text/css" href="%s">' % url
+    return ('<style>%s</style>\n'
+            '<link rel="preload" as="style" href="%s" '
+            'onload="this.onload=null;this.rel=\'stylesheet\'">\n'
+            '<noscript><link rel="stylesheet" type="text/css" href="%s">'
+            '</noscript>' % (critical_css, url, url))
+
+
+def main():
+    url, critical_css = get_bundle()
+    print(url)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Page templates, parsed once per process and shared by every REP.
+
+Templates use Python's ``%(name)s`` interpolation, as Docutils templates do,
+with ``%%`` for a literal percent sign.  `get_template` compiles a template
+into a `Template` the first time it is asked for, and only reads the file
+again once its modification time changes.
+"""
+
+from __future__ import absolute_import
+
+import io
+import os
+import re
+
+_directive = re.compile(r'%(?:\((\w+)\)s|%)')
+
+
+class Template(object):
+
+    """A compiled ``%(name)s`` template.
+
+    ``template.render(subs)`` gives the same result as ``text % subs``,
+    without re-scanning the template text for every page.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._parts = []
+        self._fields = []
+        pos = 0
+        for match in _directive.finditer(text):
+            self._literal(text[pos:match.start()])
+            if match.group(1) is None:
+                self._parts.append('%')
+            else:
+                self._fields.append((len(self._parts), match.group(1)))
+                self._parts.append(None)
+            pos = match.end()
+        self._literal(text[pos:])
+
+    def _literal(self, text):
+        if '%' in text:
+            raise ValueError('unsupported %%-format in template: %r'
+                             % text[text.index('%'):][:20])
+        self._parts.append(text)
+
+    def render(self, subs):
+        parts = self._parts[:]
+        for index, name in self._fields:
+            value = subs[name]
+            if not isinstance(value, str):
+                value = str(value)
+            parts[index] = value
+        return ''.join(parts)
+
+    def replace(self, old, new):
+        """Return a new template with `old` replaced by `new` in its text."""
+        return Template(self.text.replace(old, new))
+
+
+_cache = {}
+
+
+def get_template(path):
+    """Return the compiled template at `path`, re-reading it only when the
+    file has changed since it was last loaded."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime, stat.st_size)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != stamp:
+        with io.open(path, encoding='utf-8') as f:
+            cached = _cache[path] = (stamp, Template(f.read()))
+    return cached[1]
@@ -0,0 +1,84 @@
+"""Opt-in timing of the stages that render a REP (rep2html.py --profile).
+
+Code that renders REPs wraps each stage in ``with timing.stage(name):``.
+That costs nothing until a `Recorder` is installed as `timing.recorder`;
+from then on every stage is recorded against the REP currently being
+rendered (``recorder.rep``).
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+from contextlib import contextmanager
+
+recorder = None
+"""The active `Recorder`, or None when timing is off."""
+
+
+class Recorder(object):
+
+    """Collects ``(rep, stage, start, duration)`` events, in seconds."""
+
+    def __init__(self):
+        self.rep = None
+        self.events = []
+
+    def totals(self):
+        """Return [(rep, [(stage, seconds), ...]), ...] in the order the
+        REPs and their stages first ran, summing repeated stages."""
+        reps = []
+        stages = {}
+        for rep, name, start, duration in sorted(self.events,
+                                                 key=lambda event: event[2]):
+            if rep not in stages:
+                reps.append(rep)
+                stages[rep] = []
+            for index, (seen, seconds) in enumerate(stages[rep]):
+                if seen == name:
+                    stages[rep][index] = (name, seconds + duration)
+                    break
+            else:
+                stages[rep].append((name, duration))
+        return [(rep, stages[rep]) for rep in reps]
+
+    def write_table(self, out=None):
+        """Print a per-REP, per-stage timing table."""
+        if out is None:
+            out = sys.stdout
+        for rep, stages in self.totals():
+            print('%-16s %-52s %9s' % (rep, 'stage', 'ms'), file=out)
+            for name, seconds in stages:
+                print('%-16s %-52s %9.2f' % ('', name, 1000 * seconds),
+                      file=out)
+            print('', file=out)
+
+    def write_trace(self, path):
+        """Write the events as a Chrome trace (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        events = []
+        for rep, name, start, duration in self.events:
+            events.append({
+                'name': name, 'cat': 'rep', 'ph': 'X', 'pid': pid, 'tid': 0,
+                'ts': int(start * 1e6), 'dur': int(duration * 1e6),
+                'args': {'rep': rep}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+@contextmanager
+def stage(name):
+    """Record the time spent in the ``with`` block as stage `name`."""
+    active = recorder
+    if active is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        active.events.append((active.rep, name, start, time.time() - start))
@@ -0,0 +1,166 @@
+// Client side of the offline REP search (see repbuild/search.py).
+//
+// search/docs.json lists the REPs and their sections; every other file in
+// search/ holds the postings of the words starting with the same letters.
+// Only the shards of the words searched for are fetched, once each.
+(function () {
+  'use strict';
+
+  var STOPWORDS = {};
+  ('a an and are as at be by for from has have in is it its of on or ' +
+   'that the this to was were which will with').split(' ').forEach(
+    function (word) { STOPWORDS[word] = true; });
+
+  var requests = {};
+
+  function fetchJSON(name) {
+    if (!requests[name]) {
+      requests[name] = fetch('search/' + name + '.json').then(
+        function (response) {
+          // A missing shard means no REP has a word starting that way.
+          return response.ok ? response.json() : {};
+        });
+    }
+    return requests[name];
+  }
+
+  // Split `text` into words the way rep0.body.words does.
+  function words(text) {
+    return (text.toLowerCase().match(/[a-z0-9]+/g) || []).filter(
+      function (word) { return word.length > 1 && !STOPWORDS[word]; });
+  }
+
+  function pad(number) {
+    return ('000' + number).slice(-4);
+  }
+
+  // Resolve to the REPs containing every word of `query` (the last one
+  // may be the start of a word), best first:
+  // [{number, title, score, sections: [{anchor, title}]}].
+  function search(query) {
+    var terms = words(query);
+    if (!terms.length) {
+      return Promise.resolve([]);
+    }
+    return fetchJSON('docs').then(function (index) {
+      var prefix = index.prefix;
+      return Promise.all(terms.map(function (term) {
+        return fetchJSON(term.slice(0, prefix));
+      })).then(function (shards) {
+        var total = index.docs.length;
+        var scores = null;
+        terms.forEach(function (term, position) {
+          var shard = shards[position];
+          var matches = {};
+          Object.keys(shard).forEach(function (word) {
+            var last = position === terms.length - 1;
+            if (word !== term && !(last && word.indexOf(term) === 0)) {
+              return;
+            }
+            var postings = shard[word];
+            var docs = {};
+            postings.forEach(function (posting) { docs[posting[0]] = true; });
+            var idf = Math.log(1 + total / Object.keys(docs).length);
+            postings.forEach(function (posting) {
+              var match = matches[posting[0]] ||
+                  (matches[posting[0]] = {score: 0, sections: {}});
+              match.score += idf * Math.log(1 + posting[2]);
+              match.sections[posting[1]] = true;
+            });
+          });
+          if (scores === null) {
+            scores = matches;
+            return;
+          }
+          // Keep only the REPs that have every word.
+          var both = {};
+          Object.keys(matches).forEach(function (doc) {
+            if (scores[doc]) {
+              both[doc] = scores[doc];
+              both[doc].score += matches[doc].score;
+              Object.keys(matches[doc].sections).forEach(function (section) {
+                both[doc].sections[section] = true;
+              });
+            }
+          });
+          scores = both;
+        });
+        return Object.keys(scores).map(function (doc) {
+          var entry = index.docs[doc];
+          return {
+            number: entry[0],
+            title: entry[1],
+            score: scores[doc].score,
+            sections: Object.keys(scores[doc].sections).sort(
+              function (a, b) { return a - b; }).map(function (section) {
+                return {anchor: entry[2][section][0],
+                        title: entry[2][section][1]};
+              })
+          };
+        }).sort(function (a, b) {
+          return b.score - a.score || a.number - b.number;
+        });
+      });
+    });
+  }
+
+  function link(href, text) {
+    var a = document.createElement('a');
+    a.href = href;
+    a.textContent = text;
+    return a;
+  }
+
+  function show(query) {
+    var status = document.getElementById('rep-search-status');
+    var list = document.getElementById('rep-search-results');
+    status.textContent = 'Searching...';
+    search(query).then(function (results) {
+      list.textContent = '';
+      status.textContent = results.length + ' REP(s) found.';
+      results.forEach(function (result) {
+        var page = 'rep-' + pad(result.number) + '.html';
+        var item = document.createElement('li');
+        item.appendChild(link(page, 'REP ' + result.number + ': ' +
+                              result.title));
+        // The first few matching sections are enough to go on.
+        var sections = result.sections.filter(function (section) {
+          return section.anchor;
+        }).slice(0, 5);
+        if (sections.length) {
+          var inner = document.createElement('ul');
+          sections.forEach(function (section) {
+            var entry = document.createElement('li');
+            entry.appendChild(link(page + '#' + section.anchor,
+                                   section.title));
+            inner.appendChild(entry);
+          });
+          item.appendChild(inner);
+        }
+        list.appendChild(item);
+      });
+    }, function () {
+      status.textContent = 'The search index could not be loaded.';
+    });
+  }
+
+  window.repSearch = search;
+
+  document.addEventListener('DOMContentLoaded', function () {
+    var form = document.getElementById('rep-search');
+    if (!form) {
+      return;
+    }
+    var query = new URLSearchParams(window.location.search).get('q');
+    if (query) {
+      form.q.value = query;
+      show(query);
+    }
+    form.addEventListener('submit', function (event) {
+      event.preventDefault();
+      var value = form.q.value;
+      history.replaceState(null, '', '?q=' + encodeURIComponent(value));
+      show(value);
+    });
+  });
+}());
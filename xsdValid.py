@@ -1,8 +1,255 @@
+#!/usr/bin/env python
+"""Check the package.xml schemas of REP 127, 140 and 149.
+
+Usage: %(PROGRAM)s [options] [PATH ...]
+
+Without PATH, check that xsd/package_format{1,2,3}.xsd compile.
+
+With PATH, validate every package.xml found under each PATH (a directory,
+searched recursively, or a single file) against the schema of the format
+it declares, and print a line for each problem found.  The exit status is
+1 if any file is invalid.  The format is read from the root element's
+start tag alone, and large manifests are validated as they are read
+instead of being loaded whole.
+
+The compiled schemas are cached in %(SCHEMA_CACHE)s, next to this script,
+and only recompiled when an XSD changes.
+
+Options:
+
+-j N, --jobs=N
+    Number of files to validate in parallel (default: the number of CPUs).
+
+-v, --verbose
+    Also list the files that are valid.
+
+--json
+    Print one JSON object per file, with its "path", "format", "valid"
+    flag and list of "errors" (each with an XPath "path" and a "message"),
+    and no summary.
+
+-h, --help
+    Print this help message and exit.
+"""
+
+from __future__ import print_function
+
+import getopt
+import json
+import multiprocessing
+import os
+import pickle
+import sys
+
+from xml.etree import ElementTree
+
 import xmlschema
 
-format1 = xmlschema.XMLSchema('xsd/package_format1.xsd')
-print("'xsd/package_format1.xsd' file is valid.")
-format2 = xmlschema.XMLSchema('xsd/package_format2.xsd')
-print("'xsd/package_format2.xsd' file is valid.")
-format3 = xmlschema.XMLSchema('xsd/package_format3.xsd')
-print("'xsd/package_format3.xsd' file is valid.")
+from repbuild.manifest import atomic_write, digest
+
+PROGRAM = sys.argv[0]
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_CACHE = '.rep-xsd-cache.pickle'
+FORMATS = ('1', '2', '3')
+# Manifests larger than this (in bytes) are validated without first
+# building their whole tree.  Below it a tree is faster to validate.
+LAZY_SIZE = 1 << 20
+
+
+def schema_path(fmt):
+    return os.path.join('xsd', 'package_format%s.xsd' % fmt)
+
+
+def _schema_key():
+    # The format schemas include package_common.xsd, so hash every XSD.
+    parts = [xmlschema.__version__, sys.version]
+    xsd_dir = os.path.join(HERE, 'xsd')
+    for name in sorted(os.listdir(xsd_dir)):
+        if name.endswith('.xsd'):
+            parts.append(name)
+            with open(os.path.join(xsd_dir, name), 'rb') as f:
+                parts.append(f.read())
+    return digest(*parts)
+
+
+def load_schemas():
+    """Return {format: XMLSchema}, from the cache if the XSDs are
+    unchanged since it was written, compiling them otherwise."""
+    cache = os.path.join(HERE, SCHEMA_CACHE)
+    key = _schema_key()
+    try:
+        with open(cache, 'rb') as f:
+            cached_key, schemas = pickle.load(f)
+        if cached_key == key:
+            return schemas
+    except Exception:
+        # Missing, truncated or written by an incompatible xmlschema.
+        pass
+    schemas = {}
+    for fmt in FORMATS:
+        schemas[fmt] = xmlschema.XMLSchema(os.path.join(HERE,
+                                                        schema_path(fmt)))
+    try:
+        atomic_write(cache, pickle.dumps((key, schemas),
+                                         pickle.HIGHEST_PROTOCOL))
+    except (OSError, IOError):
+        pass
+    return schemas
+
+
+def find_manifests(paths):
+    """Yield the package.xml files under `paths`, in a stable order."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(name for name in dirnames
+                                 if not name.startswith('.'))
+            if 'package.xml' in filenames:
+                yield os.path.join(dirpath, 'package.xml')
+
+
+def read_format(source):
+    """Read the root element of the package.xml open as `source`, and
+    return (iterparse iterator, root, format).  Only the root's start tag
+    has been parsed when this returns."""
+    events = ElementTree.iterparse(source, events=('start',))
+    event, root = next(events)
+    return events, root, root.get('format', '1')
+
+
+def validate(path, schemas):
+    """Validate the package.xml at `path` against the schema of the format
+    it declares.  Return (format, [(xpath, message), ...]); format is None
+    if it could not be read."""
+    fmt = None
+    try:
+        with open(path, 'rb') as f:
+            events, root, fmt = read_format(f)
+            if fmt not in schemas:
+                return fmt, [(None, 'unsupported package format %r' % fmt)]
+            if os.fstat(f.fileno()).st_size > LAZY_SIZE:
+                # Let xmlschema stream the file rather than hold it all.
+                source = xmlschema.XMLResource(path, lazy=True)
+            else:
+                for event in events:
+                    pass
+                source = root
+            return fmt, [(error.path, error.reason)
+                         for error in schemas[fmt].iter_errors(source)]
+    except (ElementTree.ParseError, IOError, OSError) as error:
+        return fmt, [(None, str(error))]
+
+
+_worker_schemas = None
+
+
+def _init_worker():
+    global _worker_schemas
+    _worker_schemas = load_schemas()
+
+
+def _validate_in_worker(path):
+    return path, validate(path, _worker_schemas)
+
+
+def validate_all(paths, jobs=None, verbose=0, json_lines=False, out=None):
+    """Validate the package.xml files under `paths`, printing problems to
+    `out` as each file is done (as a JSON object per file if `json_lines`).
+    Return (files checked, files invalid)."""
+    if out is None:
+        out = sys.stdout
+    files = find_manifests(paths)
+    if jobs is not None:
+        jobs = max(1, jobs)
+    if jobs == 1:
+        schemas = load_schemas()
+        results = ((path, validate(path, schemas)) for path in files)
+        pool = None
+    else:
+        # Compile (or load) the schemas once here, so the workers all find
+        # them in the cache.
+        load_schemas()
+        pool = multiprocessing.Pool(jobs, initializer=_init_worker)
+        results = pool.imap(_validate_in_worker, files, chunksize=16)
+    checked = invalid = 0
+    try:
+        for path, (fmt, problems) in results:
+            checked += 1
+            if problems:
+                invalid += 1
+            if json_lines:
+                print(json.dumps({
+                    'path': path, 'format': fmt, 'valid': not problems,
+                    'errors': [{'path': xpath, 'message': message}
+                               for xpath, message in problems]},
+                    sort_keys=True), file=out)
+            elif problems:
+                for xpath, message in problems:
+                    if xpath:
+                        message = '%s: %s' % (xpath, message)
+                    print('%s: %s' % (path, message), file=out)
+            elif verbose:
+                print('%s: valid (format %s)' % (path, fmt), file=out)
+            out.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return checked, invalid
+
+
+def usage(code, msg=''):
+    """Print usage message and exit.  Uses stderr if code != 0."""
+    if code == 0:
+        out = sys.stdout
+    else:
+        out = sys.stderr
+    print(__doc__ % globals(), file=out)
+    if msg:
+        print(msg, file=out)
+    sys.exit(code)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    try:
+        opts, args = getopt.getopt(argv, 'j:vh',
+                                   ['jobs=', 'verbose', 'json', 'help'])
+    except getopt.error as msg:
+        usage(1, msg)
+    jobs = None
+    verbose = 0
+    json_lines = False
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage(0)
+        elif opt in ('-j', '--jobs'):
+            try:
+                jobs = int(arg)
+            except ValueError:
+                usage(1, 'Error: --jobs expects an integer, not %r' % arg)
+        elif opt in ('-v', '--verbose'):
+            verbose = 1
+        elif opt == '--json':
+            json_lines = True
+
+    if not args:
+        load_schemas()
+        for fmt in FORMATS:
+            print("'%s' file is valid." % schema_path(fmt))
+        return
+
+    checked, invalid = validate_all(args, jobs=jobs, verbose=verbose,
+                                    json_lines=json_lines)
+    if not json_lines:
+        print('%d package.xml file(s) checked, %d invalid.'
+              % (checked, invalid))
+    if invalid:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()